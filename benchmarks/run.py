@@ -0,0 +1,273 @@
+# run.py
+"""比较流水线基准测试
+
+为每个场景离线生成合成文件对，重复运行完整比较（结果缓存关闭、提取缓存清空），
+从 trace 中汇总各阶段耗时，记录延迟分位数、吞吐量与峰值内存，写入 JSON 基线。
+每个场景默认在独立子进程中运行，峰值 RSS 互不影响。
+
+用法：
+    python -m benchmarks.run -o baseline.json
+    python -m benchmarks.run --quick --kinds text -o new.json --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import List, NamedTuple
+
+import numpy as np
+
+from .synthetic import write_pair
+
+SIZES = (1, 50, 500)
+DENSITIES = (0.001, 0.01, 0.1, 0.5)
+KINDS = ("text", "scan", "mixed")
+QUICK_SIZES = (1, 50)
+QUICK_DENSITIES = (0.01, 0.5)
+
+
+class Scenario(NamedTuple):
+    name: str
+    kind: str
+    pages: int
+    edit_density: float
+    inserts: int
+
+
+def build_scenarios(kinds=KINDS, sizes=SIZES, densities=DENSITIES) -> List[Scenario]:
+    """场景矩阵：文本/扫描文档的页数×修改比例，插页场景，以及混合文档"""
+    scenarios = []
+    for kind in kinds:
+        if kind == "mixed":
+            for pages in sizes:
+                scenarios.append(
+                    Scenario(f"mixed-{pages}p-0.01-ins1", kind, pages, 0.01, 1)
+                )
+            continue
+        for pages in sizes:
+            for density in densities:
+                scenarios.append(
+                    Scenario(f"{kind}-{pages}p-{density}", kind, pages, density, 0)
+                )
+            inserts = max(1, pages // 10)
+            scenarios.append(
+                Scenario(
+                    f"{kind}-{pages}p-0.01-ins{inserts}", kind, pages, 0.01, inserts
+                )
+            )
+    return scenarios
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _stage_totals(trace: dict) -> dict:
+    """按 span 名称汇总耗时（不含根 span）"""
+    totals = defaultdict(float)
+    stack = list(trace.get("children", ()))
+    while stack:
+        node = stack.pop()
+        totals[node["name"]] += node["wall"] or 0.0
+        stack.extend(node.get("children", ()))
+    return totals
+
+
+def _percentiles(values) -> dict:
+    values = np.asarray(values)
+    return {
+        "mean": round(float(values.mean()), 4),
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p90": round(float(np.percentile(values, 90)), 4),
+        "p99": round(float(np.percentile(values, 99)), 4),
+        "min": round(float(values.min()), 4),
+    }
+
+
+def run_scenario(scenario: Scenario, repeats=3, warmup=1, executor="thread") -> dict:
+    """运行单个场景，返回延迟、阶段耗时、吞吐量与内存统计"""
+    os.environ["PDF_DIFF_RESULT_CACHE"] = "0"
+    from src.pdf_processing.document_cache import document_cache
+    from src.utils.async_utils import compare_cached
+    from src.utils.executors import configure_executors
+
+    configure_executors(executor)
+    rss_before = _peak_rss_mb()
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        path1, path2 = write_pair(
+            workdir,
+            scenario.name,
+            kind=scenario.kind,
+            pages=scenario.pages,
+            edit_density=scenario.edit_density,
+            inserts=scenario.inserts,
+        )
+        generate_time = time.perf_counter() - start
+
+        latencies = []
+        stages = defaultdict(list)
+        result = None
+        for run in range(warmup + repeats):
+            # 每次运行都从冷的提取缓存开始
+            document_cache.clear()
+            result = asyncio.run(compare_cached(path1, path2, trace=True))
+            if result.get("type") == "error":
+                raise RuntimeError(result.get("message"))
+            if run < warmup:
+                continue
+            latencies.append(result["trace"]["wall"])
+            for name, total in _stage_totals(result["trace"]).items():
+                stages[name].append(total)
+
+    latency = _percentiles(latencies)
+    page_stats = result.get("page_stats", {})
+    return {
+        "kind": scenario.kind,
+        "pages": scenario.pages,
+        "edit_density": scenario.edit_density,
+        "inserts": scenario.inserts,
+        "repeats": repeats,
+        "generate_seconds": round(generate_time, 3),
+        "latency": latency,
+        "pages_per_second": round(scenario.pages / latency["mean"], 2),
+        "stages": {
+            name: round(sum(values) / len(values), 4)
+            for name, values in sorted(stages.items())
+        },
+        "peak_rss_mb": _peak_rss_mb(),
+        "rss_growth_mb": (
+            round(_peak_rss_mb() - rss_before, 1) if rss_before is not None else None
+        ),
+        "result": {
+            "type": result.get("type"),
+            "page_stats": page_stats,
+            "text_changes": len(result.get("details", ())),
+            "image_changed_pages": result.get("summary", {}).get("changed", 0),
+        },
+    }
+
+
+def _run_isolated(scenario, repeats, warmup, executor):
+    # spawn 子进程中从零导入，峰值 RSS 只反映该场景
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(run_scenario, scenario, repeats, warmup, executor).result()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(scenarios, repeats=3, warmup=1, executor="thread", isolate=True):
+    """运行全部场景，返回基线字典"""
+    baseline = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "executor": executor,
+            "extractor": os.environ.get("PDF_DIFF_EXTRACTOR", "pdfplumber"),
+            "repeats": repeats,
+        },
+        "scenarios": {},
+    }
+    for scenario in scenarios:
+        print(f"运行 {scenario.name} ...", flush=True)
+        try:
+            if isolate:
+                stats = _run_isolated(scenario, repeats, warmup, executor)
+            else:
+                stats = run_scenario(scenario, repeats, warmup, executor)
+        except Exception as e:
+            stats = {"error": f"{type(e).__name__}: {e}"}
+            print(f"  失败: {stats['error']}")
+        else:
+            print(
+                f"  p50 {stats['latency']['p50']:.3f}s, "
+                f"{stats['pages_per_second']} 页/秒, 峰值 {stats['peak_rss_mb']} MB"
+            )
+        baseline["scenarios"][scenario.name] = stats
+    return baseline
+
+
+def compare_baselines(old: dict, new: dict) -> List[str]:
+    """对比两次基线的 p50 延迟与峰值内存"""
+    lines = [f"{'场景':<28}{'p50 旧':>10}{'p50 新':>10}{'变化':>9}{'内存变化':>11}"]
+    for name, stats in new["scenarios"].items():
+        before = old.get("scenarios", {}).get(name)
+        if not before or "error" in before or "error" in stats:
+            continue
+        p50_old, p50_new = before["latency"]["p50"], stats["latency"]["p50"]
+        change = (p50_new - p50_old) / p50_old * 100 if p50_old else 0.0
+        memory = (
+            f"{stats['peak_rss_mb'] - before['peak_rss_mb']:+.1f}MB"
+            if stats.get("peak_rss_mb") and before.get("peak_rss_mb")
+            else "-"
+        )
+        lines.append(
+            f"{name:<28}{p50_old:>10.3f}{p50_new:>10.3f}{change:>+8.1f}%{memory:>11}"
+        )
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF比较流水线基准测试")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="基线输出路径")
+    parser.add_argument("--compare", help="与该基线文件对比")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--sizes", nargs="+", type=int)
+    parser.add_argument("--densities", nargs="+", type=float)
+    parser.add_argument("--quick", action="store_true", help="只运行较小的场景矩阵")
+    parser.add_argument("--only", nargs="+", help="只运行名称包含这些字符串的场景")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument(
+        "--executor", choices=("thread", "process", "inline"), default="thread"
+    )
+    parser.add_argument(
+        "--no-isolate", action="store_true", help="在当前进程中运行所有场景"
+    )
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    densities = args.densities or (QUICK_DENSITIES if args.quick else DENSITIES)
+    scenarios = build_scenarios(args.kinds, sizes, densities)
+    if args.only:
+        scenarios = [s for s in scenarios if any(key in s.name for key in args.only)]
+
+    baseline = run_suite(
+        scenarios, args.repeats, args.warmup, args.executor, not args.no_isolate
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+    print(f"基线已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print("\n".join(compare_baselines(json.load(f), baseline)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# synthetic.py
+"""离线生成可复现的合成PDF文件对
+
+所有生成器只依赖 PyMuPDF 与 numpy，相同参数与随机种子总是生成相同的文件：
+- 文本页：固定词表组成的多行文本
+- 扫描页：只含一张整页位图的页面，位图中的横条模拟扫描文字行
+- 混合文档：文本页与扫描页交替
+
+edit_density 为被修改的词元比例（文本页为单词，扫描页为文字行），
+inserts 为对比文件中插入的新页面数量。
+"""
+
+import os
+from typing import List, Tuple
+
+import fitz
+import numpy as np
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4，单位 pt
+LINES_PER_PAGE = 45
+WORDS_PER_LINE = 10
+FONT_SIZE = 9
+LINE_HEIGHT = 16
+MARGIN = 56
+# 扫描页位图尺寸（约 100 DPI）
+SCAN_WIDTH, SCAN_HEIGHT = 827, 1169
+SCAN_LINE_HEIGHT = 10
+SCAN_LINE_GAP = 14
+
+VOCABULARY = (
+    "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi "
+    "omicron pi rho sigma tau upsilon phi chi psi omega contract clause party "
+    "payment term notice section schedule annex amount date signature"
+).split()
+
+
+def _text_page_words(rng) -> List[List[str]]:
+    return [list(rng.choice(VOCABULARY, WORDS_PER_LINE)) for _ in range(LINES_PER_PAGE)]
+
+
+def _scan_page_lines(rng) -> List[Tuple[int, int]]:
+    """扫描页的文字行：(起始 x, 长度) 列表"""
+    count = (SCAN_HEIGHT - 2 * MARGIN) // (SCAN_LINE_HEIGHT + SCAN_LINE_GAP)
+    return [
+        (int(rng.integers(60, 120)), int(rng.integers(200, SCAN_WIDTH - 180)))
+        for _ in range(count)
+    ]
+
+
+def _edit_text_page(words, rng, count):
+    """替换 count 个单词，返回修改后的副本"""
+    flat = [(i, j) for i in range(len(words)) for j in range(len(words[i]))]
+    edited = [list(line) for line in words]
+    for k in rng.choice(len(flat), count, replace=False):
+        i, j = flat[k]
+        edited[i][j] = f"edit{int(rng.integers(1000, 9999))}"
+    return edited
+
+
+def _edit_scan_page(lines, rng, count):
+    """改变 count 个文字行的长度与位置，返回修改后的副本"""
+    edited = list(lines)
+    for k in rng.choice(len(lines), count, replace=False):
+        x, length = edited[k]
+        edited[k] = (x + 40, max(40, length // 2))
+    return edited
+
+
+def _tokens(content):
+    """页面中可修改的词元数"""
+    if content and isinstance(content[0], list):
+        return sum(len(line) for line in content)
+    return len(content)
+
+
+def _edit_counts(contents, density, rng):
+    """按整个文档的词元总数与修改比例，将修改随机分配到各页"""
+    sizes = [_tokens(content) for content in contents]
+    total = sum(sizes)
+    if density <= 0 or total == 0:
+        return [0] * len(contents)
+    edits = min(total, max(1, round(total * density)))
+    positions = rng.choice(total, edits, replace=False)
+    bounds = np.cumsum(sizes)
+    return list(
+        np.bincount(
+            np.searchsorted(bounds, positions, side="right"), minlength=len(sizes)
+        )
+    )
+
+
+def _draw_text_page(doc, words):
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    page.insert_text(
+        (MARGIN, MARGIN),
+        "\n".join(" ".join(line) for line in words),
+        fontsize=FONT_SIZE,
+        lineheight=LINE_HEIGHT / FONT_SIZE,
+    )
+
+
+def _draw_scan_page(doc, lines):
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    img = np.full((SCAN_HEIGHT, SCAN_WIDTH), 255, np.uint8)
+    y = MARGIN
+    for x, length in lines:
+        img[y : y + SCAN_LINE_HEIGHT, x : x + length] = 30
+        y += SCAN_LINE_HEIGHT + SCAN_LINE_GAP
+    pixmap = fitz.Pixmap(fitz.csGRAY, SCAN_WIDTH, SCAN_HEIGHT, img.tobytes(), False)
+    page.insert_image(page.rect, pixmap=pixmap)
+
+
+def _page_kinds(kind, pages):
+    if kind == "mixed":
+        return ["text" if i % 2 == 0 else "scan" for i in range(pages)]
+    return [kind] * pages
+
+
+def make_pair(
+    kind="text", pages=1, edit_density=0.01, inserts=0, seed=0
+) -> Tuple[bytes, bytes]:
+    """生成一对PDF文件
+
+    参数：
+    kind (str): 'text'、'scan' 或 'mixed'
+    pages (int): 原始文件页数
+    edit_density (float): 对比文件中被修改的词元比例
+    inserts (int): 对比文件中均匀插入的新页面数量
+    seed (int): 随机种子
+
+    返回：
+    (bytes, bytes): 原始文件与对比文件的内容
+    """
+    if kind not in ("text", "scan", "mixed"):
+        raise ValueError(f"不支持的文档类型: {kind}")
+    rng = np.random.default_rng(seed)
+    kinds = _page_kinds(kind, pages)
+    contents = [
+        _text_page_words(rng) if k == "text" else _scan_page_lines(rng) for k in kinds
+    ]
+
+    edit_counts = _edit_counts(contents, edit_density, rng)
+
+    original, modified = fitz.open(), fitz.open()
+    insert_at = set(
+        np.linspace(0, pages, inserts, endpoint=False).astype(int) if inserts else ()
+    )
+    for index, (page_kind, content, count) in enumerate(
+        zip(kinds, contents, edit_counts)
+    ):
+        draw = _draw_text_page if page_kind == "text" else _draw_scan_page
+        edit = _edit_text_page if page_kind == "text" else _edit_scan_page
+        draw(original, content)
+        if index in insert_at:
+            new_content = (
+                _text_page_words(rng) if page_kind == "text" else _scan_page_lines(rng)
+            )
+            draw(modified, new_content)
+        draw(modified, edit(content, rng, int(count)) if count else content)
+
+    try:
+        return original.tobytes(garbage=3, deflate=True), modified.tobytes(
+            garbage=3, deflate=True
+        )
+    finally:
+        original.close()
+        modified.close()
+
+
+def write_pair(directory, name, **kwargs) -> Tuple[str, str]:
+    """生成一对PDF文件并写入目录，返回两个文件路径"""
+    data1, data2 = make_pair(**kwargs)
+    path1 = os.path.join(directory, f"{name}_original.pdf")
+    path2 = os.path.join(directory, f"{name}_modified.pdf")
+    for path, data in ((path1, data1), (path2, data2)):
+        with open(path, "wb") as f:
+            f.write(data)
+    return path1, path2
@@ -1,13 +1,7 @@
-from io import BytesIO
 import sys
 import os
-import base64
-import asyncio
+import time
 import streamlit as st
-import pdfplumber
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from PyPDF2 import PdfReader, PdfWriter
 
 # 设置页面配置
 st.set_page_config(layout="wide", page_title="PDF差异分析工具")
@@ -16,8 +10,17 @@ st.set_page_config(layout="wide", page_title="PDF差异分析工具")
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
-from src.utils.async_utils import async_compare
-from src.utils.timer import Timer
+from src.utils.async_utils import preload_models
+from src.pdf_processing.preview import (
+    PAGE_DPI,
+    THUMBNAIL_DPI,
+    changed_pairs,
+    render_png,
+)
+from src.utils.jobs import get_job_manager
+
+# 预热模型（进程内只加载一次，Streamlit 重新运行脚本时直接复用）
+preload_models()
 
 # 自定义CSS样式
 st.markdown(
@@ -42,18 +45,30 @@ st.markdown(
         padding: 10px;
         margin: 1rem 0;
     }
-    .pdf-preview {
-        box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-        border-radius: 8px;
-        overflow: hidden;
-    }
 </style>
 """,
     unsafe_allow_html=True,
 )
 
 
-async def main():
+# 会话超过该秒数未轮询任务（页面已关闭）时取消任务
+HEARTBEAT_SECONDS = 15
+POLL_INTERVAL = 0.3
+# 缩略图每组数量与每行数量
+THUMBNAILS_PER_GROUP = 8
+THUMBNAILS_PER_ROW = 4
+# 图像差异预览图的宽度（像素）
+PREVIEW_WIDTH = 900
+STAGE_LABELS = {
+    "fingerprint": "计算页面指纹",
+    "extract": "提取文本",
+    "text": "比较文本",
+    "image": "比较图像页",
+    "annotate": "标注差异",
+}
+
+
+def main():
     """主应用逻辑"""
     st.title("📑 PDF智能差异分析系统")
 
@@ -64,19 +79,81 @@ async def main():
     with col2:
         file2 = st.file_uploader("上传对比文件", type="pdf")
 
+    manager = get_job_manager()
     if st.button("开始分析", type="primary") and file1 and file2:
-        with st.status("分析进行中...", expanded=True) as status:
-            with Timer() as timer:
-                result = await async_compare(file1, file2)
+        # 重新分析时取消本会话中尚未结束的上一次任务
+        previous = st.session_state.get("job_id")
+        if previous:
+            manager.cancel(previous)
+            manager.discard(previous)
+        job = manager.submit(
+            file1.getvalue(), file2.getvalue(), heartbeat=HEARTBEAT_SECONDS
+        )
+        st.session_state["job_id"] = job.job_id
+        st.session_state["job_files"] = upload_key(file1, file2)
+        st.session_state.pop("job_outcome", None)
+
+    # 任务在后台运行，脚本重新执行（如点击取消）时继续跟踪同一任务
+    job_id = st.session_state.get("job_id")
+    if not job_id or not (file1 and file2):
+        return
+    if st.session_state.get("job_files") != upload_key(file1, file2):
+        return
+    outcome = st.session_state.get("job_outcome")
+    if outcome is None:
+        job = manager.get(job_id)
+        if job is None:
+            return
+        if not job.finished:
+            track_job(manager, job)
+        # 结果转存到会话状态后丢弃任务，任务队列不再持有结果
+        outcome = {
+            "status": job.status,
+            "result": job.result,
+            "error": job.error,
+        }
+        st.session_state["job_outcome"] = outcome
+        manager.discard(job_id)
+
+    if outcome["status"] == "done":
+        render_comparison_result(file1, file2, outcome["result"], job_id)
+    elif outcome["status"] == "cancelled":
+        st.warning("分析已取消")
+    elif outcome["status"] == "timeout":
+        st.error(f"分析超时: {outcome['error']}")
+    else:
+        st.error(f"分析失败: {outcome['error']}")
+
+
+def upload_key(file1, file2):
+    return (file1.name, file1.size, file2.name, file2.size)
+
+
+def track_job(manager, job):
+    """显示任务进度直到任务结束"""
+    if st.button("取消分析"):
+        manager.cancel(job.job_id)
+    with st.status("分析进行中...", expanded=True) as status:
+        bar = st.progress(0.0, text="排队中...")
+        while not job.finished:
+            job.touch()
+            event = job.progress
+            if event is not None and event["total"]:
+                label = STAGE_LABELS.get(event["stage"], event["stage"])
+                bar.progress(
+                    min(event["done"] / event["total"], 1.0),
+                    text=f"{label} {event['done']}/{event['total']}",
+                )
+            time.sleep(POLL_INTERVAL)
+        if job.status == "done":
             status.update(
-                label=f"分析完成（耗时 {timer.elapsed:.2f}s）", state="complete"
+                label=f"分析完成（耗时 {job.elapsed:.2f}s）", state="complete"
             )
-
-            # 显示分析结果
-            render_comparison_result(file1, file2, result)
+        else:
+            status.update(label="分析未完成", state="error")
 
 
-def render_comparison_result(file1, file2, result):
+def render_comparison_result(file1, file2, result, job_id):
     """渲染对比结果"""
     st.subheader("🔍 分析结果")
 
@@ -84,117 +161,104 @@ def render_comparison_result(file1, file2, result):
     tab1, tab2 = st.tabs(["并排对比", "差异详情"])
 
     with tab1:
-        render_side_by_side(file1, file2, result)
+        render_page_viewer(file1, file2, result, job_id)
 
     with tab2:
-        render_diff_details(result)
-
-
-def render_side_by_side(file1, file2, result=None):
-    col1, col2 = st.columns(2)
-    with col1:
-        show_pdf(file1.getvalue(), "原始文件")
-    with col2:
-        if result and isinstance(result, dict):  # 添加类型检查
-            if "annotated_pdf" in result and os.path.exists(result["annotated_pdf"]):
-                try:
-                    with open(result["annotated_pdf"], "rb") as f:
-                        show_pdf(f.read(), "对比文件（差异标注）")
-                except Exception as e:
-                    st.error(f"加载标注文件失败: {str(e)}")
-            else:
-                show_pdf(file2.getvalue(), "对比文件")
-        else:
-            show_pdf(file2.getvalue(), "对比文件")
-
-
-def show_pdf(pdf_bytes, title):
-    """通用PDF展示组件"""
-    base64_pdf = base64.b64encode(pdf_bytes).decode("utf-8")
-    pdf_display = f"""
-    <div class="pdf-preview">
-        <embed src="data:application/pdf;base64,{base64_pdf}" 
-             width="100%" 
-             height="800px" 
-             type="application/pdf">
-    </div>"""
-    st.markdown(f"**{title}**")
-    st.markdown(pdf_display, unsafe_allow_html=True)
-
-
-def render_annotated_pdf(file, result):
-    """在 PDF 中高亮显示差异"""
-    st.markdown("**对比文件（差异高亮）**")
-    annotated_pdf = highlight_differences(file, result)
-    render_pdf_preview(annotated_pdf, "高亮后的PDF")
-
-
-def highlight_differences(file, result):
-    """在 PDF 页面上高亮显示差异"""
-    from reportlab.lib.units import inch
-
-    # 打开源 PDF 文件
-    source_pdf = PdfReader(file)
-    output_pdf = PdfWriter()
-    packet = BytesIO()
-    can = canvas.Canvas(packet, pagesize=letter)
-
-    with pdfplumber.open(file) as pdf:
-        for page_num, page in enumerate(pdf.pages):
-            if page_num >= len(result["diffs"]):
-                break
-            diffs = result["diffs"][page_num]
-            for diff in diffs:
-                x0, y0, x1, y1 = diff["bbox"]
-                can.setFillColorRGB(1, 0, 0, alpha=0.3)  # 红色半透明
-                can.rect(
-                    x0 * inch,
-                    (page.height - y1) * inch,
-                    (x1 - x0) * inch,
-                    (y1 - y0) * inch,
-                    fill=1,
-                )
-            can.showPage()  # 为每一页结束添加页面
+        render_diff_details(result, job_id)
 
-    can.save()
 
-    # 将高亮内容合并到原始 PDF
-    packet.seek(0)
-    highlight_pdf = PdfReader(packet)
+@st.cache_data(max_entries=1024, show_spinner=False)
+def page_png(doc_key, page_number, dpi, _load):
+    """按 (文档标识, 页码, dpi) 缓存渲染结果，脚本重新运行与切换标签页时不再渲染
 
-    for page_num in range(len(source_pdf.pages)):
-        source_page = source_pdf.pages[page_num]
-        if page_num < len(highlight_pdf.pages):
-            highlight_page = highlight_pdf.pages[page_num]
-            source_page.merge_page(highlight_page)
-        output_pdf.add_page(source_page)
+    _load 返回PDF内容，只在未命中缓存时调用（下划线参数不参与缓存键的计算）。
+    """
+    return render_png(_load(), page_number, dpi)
+
+
+def render_page_viewer(file1, file2, result, job_id):
+    """逐页查看：只发送有差异页面的缩略图，点击后按需渲染整页"""
+    # 文本页使用标注后的PDF，纯图像比较没有标注PDF时使用上传文件
+    sides = (
+        (
+            f"{job_id}:original",
+            lambda: result.get("annotated_original_pdf") or file1.getvalue(),
+        ),
+        (
+            f"{job_id}:modified",
+            lambda: result.get("annotated_pdf") or file2.getvalue(),
+        ),
+    )
+    show_all = st.checkbox("显示全部页面", key=f"show_all:{job_id}")
+    pairs = changed_pairs(result.get("page_map", ()), include_unchanged=show_all)
+    if not pairs:
+        st.success("未发现页面差异")
+        return
 
-    # 返回合并后的 PDF 内容
-    output_stream = BytesIO()
-    output_pdf.write(output_stream)
-    output_stream.seek(0)
-    return output_stream
+    state_key = f"viewer:{job_id}"
+    index = min(st.session_state.get(state_key, 0), len(pairs) - 1)
+
+    def select(i):
+        st.session_state[state_key] = i % len(pairs)
+
+    nav = st.columns([1, 3, 1])
+    nav[0].button("⬅ 上一处差异", on_click=select, args=(index - 1,))
+    nav[1].markdown(f"**第 {index + 1} / {len(pairs)} 处**（{pairs[index][2]}）")
+    nav[2].button("下一处差异 ➡", on_click=select, args=(index + 1,))
+    render_page_pair(sides, pairs[index], PAGE_DPI)
+
+    # 缩略图分组展示，只渲染当前组
+    st.markdown("**差异页面**")
+    group = index // THUMBNAILS_PER_GROUP
+    groups = (len(pairs) - 1) // THUMBNAILS_PER_GROUP + 1
+    if groups > 1:
+        group = (
+            st.number_input(
+                "缩略图分组", 1, groups, group + 1, key=f"group:{job_id}:{index}"
+            )
+            - 1
+        )
+    first = group * THUMBNAILS_PER_GROUP
+    columns = st.columns(THUMBNAILS_PER_ROW)
+    for offset, pair in enumerate(pairs[first : first + THUMBNAILS_PER_GROUP]):
+        i = first + offset
+        with columns[offset % THUMBNAILS_PER_ROW]:
+            images, captions = [], []
+            for (doc_key, load), page_number in zip(sides, pair[:2]):
+                if page_number is not None:
+                    images.append(page_png(doc_key, page_number, THUMBNAIL_DPI, load))
+                    captions.append(f"第 {page_number + 1} 页")
+            st.image(images, caption=captions)
+            st.button(
+                "查看" if i != index else "当前",
+                key=f"thumb:{job_id}:{i}",
+                on_click=select,
+                args=(i,),
+                disabled=i == index,
+            )
 
 
-def render_pdf_preview(file, title):
-    """PDF预览组件"""
-    st.markdown(f"**{title}**")
-    if isinstance(file, BytesIO):
-        base64_pdf = base64.b64encode(file.getvalue()).decode("utf-8")
-    else:
-        base64_pdf = base64.b64encode(file.getvalue()).decode("utf-8")
-    pdf_display = f"""
-    <div class="pdf-preview">
-        <embed src="data:application/pdf;base64,{base64_pdf}" 
-             width="100%" 
-             height="800px" 
-             type="application/pdf">
-    </div>
-    """
-    st.markdown(pdf_display, unsafe_allow_html=True)
+def render_page_pair(sides, pair, dpi):
+    """并排显示一个页对的整页渲染"""
+    columns = st.columns(2)
+    titles = ("原始文件（删除标注）", "对比文件（新增标注）")
+    missing = ("（对比文件中新增的页面）", "（对比文件中已删除）")
+    for column, (doc_key, load), page_number, title, note in zip(
+        columns, sides, pair[:2], titles, missing
+    ):
+        with column:
+            st.markdown(f"**{title}**")
+            if page_number is None:
+                st.info(note)
+            else:
+                st.image(
+                    page_png(doc_key, page_number, dpi, load),
+                    caption=f"第 {page_number + 1} 页",
+                    use_column_width=True,
+                )
 
 
-def render_diff_details(result):
+def render_diff_details(result, job_id):
     """差异详情渲染"""
     if "type" not in result:
         st.error("无效的分析结果")
@@ -209,11 +273,16 @@ def render_diff_details(result):
 
         elif result["type"] == "image":
             # 验证图像结果结构
-            required_keys = ["original", "diff"]
+            required_keys = ["original", "regions"]
             for key in required_keys:
                 if key not in result:
                     raise KeyError(f"缺失必要字段: {key}")
-            render_image_diff(result)
+            render_image_diff(result, job_id)
+
+        elif result["type"] == "mixed":
+            # 混合文档：文本页与扫描页分别展示
+            render_text_diff(result)
+            render_image_diff(result, job_id)
 
     except KeyError as e:
         st.error(f"数据格式错误: {str(e)}")
@@ -246,48 +315,64 @@ def render_text_diff(result):
             )
 
 
-def render_image_diff(result):
-    """图像差异渲染"""
+def render_image_diff(result, job_id):
+    """图像差异渲染：在缩小后的预览图上绘制后端合并好的差异区域"""
     st.subheader("🖼️ 图像差异")
 
+    preview = preview_image(job_id, result["original"])
+    regions = result["regions"]
     col1, col2 = st.columns(2)
     with col1:
         st.markdown("**原始图像**")
-        st.image(result["original"], use_column_width=True)  # 使用原始图像数据
+        st.image(preview, use_column_width=True)
 
     with col2:
-        st.markdown("**差异标记**")
+        st.markdown(f"**差异标记**（{len(regions)} 处）")
         st.markdown('<div class="diff-image-container">', unsafe_allow_html=True)
-        annotated_img = annotate_diff_image(result["original"], result["diff"])
+        annotated_img = annotate_diff_image(job_id, result["original"], regions)
         st.image(annotated_img, use_column_width=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
 
-def annotate_diff_image(original, diff_mask):
-    """图像差异标注"""
+@st.cache_data(max_entries=64, show_spinner=False)
+def preview_image(key, _image):
+    """将预览页缩小到 PREVIEW_WIDTH 宽度（按任务标识缓存）"""
     import cv2
     import numpy as np
 
-    original_np = np.array(original)
-    diff_np = np.array(diff_mask)
+    image = np.asarray(_image)
+    height, width = image.shape[:2]
+    if width <= PREVIEW_WIDTH:
+        return image
+    size = (PREVIEW_WIDTH, round(height * PREVIEW_WIDTH / width))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
 
-    # 创建红色半透明覆盖层
-    overlay = original_np.copy()
-    # 使用广播机制确保赋值的输入值数量与布尔掩码为 True 的位置数量匹配
-    overlay[diff_np > 0] = np.array([0, 0, 255])
 
-    # 混合图像
-    alpha = 0.3
-    cv2.addWeighted(overlay, alpha, original_np, 1 - alpha, 0, original_np)
+@st.cache_data(max_entries=64, show_spinner=False)
+def annotate_diff_image(key, _original, regions):
+    """图像差异标注
+
+    区域已在后端去噪、合并并限制了数量，这里只在缩小后的预览图上
+    绘制半透明填充与边框，开销与原图分辨率和噪点多少无关。
+    """
+    import cv2
+    import numpy as np
 
-    # 绘制边界框
-    contours, _ = cv2.findContours(diff_np, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        cv2.rectangle(original_np, (x, y), (x + w, y + h), (0, 0, 255), 2)
+    preview = preview_image(key, _original)
+    scale = preview.shape[1] / np.asarray(_original).shape[1]
+    annotated = preview.copy()
+    overlay = preview.copy()
+    rects = [tuple(int(round(v * scale)) for v in region["box"]) for region in regions]
+    for x0, y0, x1, y1 in rects:
+        cv2.rectangle(overlay, (x0, y0), (x1, y1), (255, 0, 0), -1)
 
-    return original_np
+    # 混合半透明填充后再绘制边框
+    alpha = 0.25
+    cv2.addWeighted(overlay, alpha, annotated, 1 - alpha, 0, annotated)
+    for x0, y0, x1, y1 in rects:
+        cv2.rectangle(annotated, (x0, y0), (x1, y1), (255, 0, 0), 2)
+    return annotated
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
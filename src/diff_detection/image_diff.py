@@ -1,17 +1,199 @@
+from functools import partial
+
 import cv2
+import numpy as np
 import torch.nn as nn
 import torch
 from skimage.metrics import structural_similarity
 from torchvision.models import resnet18  # 直接导入 resnet18 模型定义
 from torchvision.models import ResNet18_Weights
 
+from ..utils.inference import (
+    DEFAULT_BATCH_SIZE,
+    batched_forward,
+    configure_threads,
+    default_optimization,
+    optimize_model,
+)
+from ..utils.model_registry import registry
+
+DEFAULT_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+# 分块 SSIM：金字塔降采样倍数与全分辨率分块边长
+PYRAMID_SCALE = 4
+TILE_SIZE = 256
+# 降采样层上最小 SSIM 低于该值、或最大灰度差超过该值的分块需要全分辨率复算
+COARSE_SSIM = 0.95
+COARSE_DIFF = 8
+# 相似度图中低于该值（0-255）的像素视为差异像素，用于生成差异区域框
+CHANGED_PIXEL = int(0.8 * 255)
+# 差异区域提取：去噪开运算核边长、合并网格的单元边长（像素）、
+# 合并间距（单元数）、区域最少差异像素数与每页区域数量上限
+NOISE_KERNEL = 3
+REGION_CELL = 4
+MERGE_GAP = 4
+MIN_REGION_PIXELS = 20
+MAX_REGIONS = 32
+# 区域过多时加大合并间距的次数（每次翻倍）
+MERGE_ROUNDS = 3
+
+
+def to_gray(img):
+    """转换为 uint8 灰度图（灰度快速路径）"""
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    if img.dtype != np.uint8:
+        img = np.clip(img, 0, 255).astype(np.uint8)
+    return img
+
+
+def ssim_map(img1, img2, win_size=7):
+    """单通道 uint8 图像的 SSIM 图（float32）
+
+    与 skimage 默认参数（均匀窗口、样本协方差、反射边界）等价，
+    使用 OpenCV 的 float32 盒式滤波代替 float64 计算。
+    """
+    x = img1.astype(np.float32)
+    y = img2.astype(np.float32)
+    window = (win_size, win_size)
+
+    def blur(a):
+        return cv2.blur(a, window, borderType=cv2.BORDER_REFLECT)
+
+    n = win_size * win_size
+    cov_norm = n / (n - 1)
+    ux, uy = blur(x), blur(y)
+    vx = cov_norm * (blur(x * x) - ux * ux)
+    vy = cov_norm * (blur(y * y) - uy * uy)
+    vxy = cov_norm * (blur(x * y) - ux * uy)
+
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    return ((2 * ux * uy + c1) * (2 * vxy + c2)) / (
+        (ux * ux + uy * uy + c1) * (vx + vy + c2)
+    )
+
+
+def _to_mask(ssim):
+    return (np.clip(ssim, 0, 1) * 255).astype(np.uint8)
+
+
+def _cell_sums(values, cell):
+    """按 cell x cell 的网格单元求和（边缘补零）"""
+    height, width = values.shape
+    rows, cols = -(-height // cell), -(-width // cell)
+    padded = np.zeros((rows * cell, cols * cell), values.dtype)
+    padded[:height, :width] = values
+    return padded.reshape(rows, cell, cols, cell).sum(axis=(1, 3))
+
+
+def diff_regions(
+    mask,
+    threshold=CHANGED_PIXEL,
+    merge_gap=MERGE_GAP,
+    max_regions=MAX_REGIONS,
+    min_pixels=MIN_REGION_PIXELS,
+):
+    """从相似度图提取合并后的差异区域
+
+    阈值化后用开运算去除孤立噪点，再在 REGION_CELL 像素的网格上膨胀，
+    合并间距内的相邻连通区域；区域仍多于 max_regions 时加大间距重新合并，
+    最后只保留差异像素最多的 max_regions 个区域。
+    开销与页面像素数成正比，与噪点数量无关。
+
+    返回：
+    list: 按差异像素数降序的区域 {"box": (x0, y0, x1, y1),
+          "score": 区域内差异像素的平均差异度 (0~1), "pixels": 差异像素数}
+    """
+    changed = (mask < threshold).astype(np.uint8)
+    kernel = np.ones((NOISE_KERNEL, NOISE_KERNEL), np.uint8)
+    changed = cv2.morphologyEx(changed, cv2.MORPH_OPEN, kernel)
+    if not changed.any():
+        return []
+
+    height, width = mask.shape
+    pixels = _cell_sums(changed, REGION_CELL).astype(np.int64)
+    dissimilarity = _cell_sums(
+        (255 - mask.astype(np.int32)) * changed, REGION_CELL
+    ).astype(np.int64)
+    grid = (pixels > 0).astype(np.uint8)
+
+    gap = merge_gap
+    for _ in range(MERGE_ROUNDS):
+        merged = cv2.dilate(grid, np.ones((gap + 1, gap + 1), np.uint8))
+        count, labels = cv2.connectedComponents(merged, connectivity=8)
+        if count - 1 <= max_regions:
+            break
+        gap *= 2
+
+    # 以膨胀前的网格单元计算各区域的紧致外接框与统计量
+    ys, xs = np.nonzero(grid)
+    label = labels[ys, xs]
+    x0 = np.full(count, grid.shape[1], np.int64)
+    y0 = np.full(count, grid.shape[0], np.int64)
+    x1 = np.zeros(count, np.int64)
+    y1 = np.zeros(count, np.int64)
+    np.minimum.at(x0, label, xs)
+    np.minimum.at(y0, label, ys)
+    np.maximum.at(x1, label, xs + 1)
+    np.maximum.at(y1, label, ys + 1)
+    region_pixels = np.bincount(label, pixels[ys, xs], minlength=count)
+    region_dissimilarity = np.bincount(label, dissimilarity[ys, xs], minlength=count)
+
+    order = np.argsort(-region_pixels[1:], kind="stable") + 1
+    regions = []
+    for i in order[:max_regions]:
+        if region_pixels[i] < min_pixels:
+            break
+        regions.append(
+            {
+                "box": (
+                    int(x0[i] * REGION_CELL),
+                    int(y0[i] * REGION_CELL),
+                    int(min(x1[i] * REGION_CELL, width)),
+                    int(min(y1[i] * REGION_CELL, height)),
+                ),
+                "score": round(
+                    float(region_dissimilarity[i] / region_pixels[i] / 255), 4
+                ),
+                "pixels": int(region_pixels[i]),
+            }
+        )
+    return regions
+
 
 class ImageComparator:
-    def __init__(self):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = self._load_model()
+    """页面图像比较：SSIM 结构相似度与 ResNet18 深度比较
+
+    参数：
+    device (str): 深度比较使用的设备 (默认: auto)
+    optimize (str): CPU 推理优化 'none'、'int8' 或 'torchscript'
+                    (默认: PDF_DIFF_MODEL_OPTIMIZE)
+    batch_size (int): 深度比较一次前向传播的页对数 (默认: 16)
+    """
+
+    def __init__(self, device=None, optimize=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.device = torch.device(device or DEFAULT_DEVICE)
+        self.optimize = optimize or default_optimization()
+        self.batch_size = batch_size
+
+    @property
+    def model(self):
+        # 从进程级注册表获取模型，多次比较复用同一个模型；
+        # 仅在深度比较时加载，只做 SSIM 的工作进程不会加载模型
+        return registry.get(
+            self.model_key(self.device, self.optimize),
+            partial(self._load_model, self.device, self.optimize),
+        )
+
+    @staticmethod
+    def model_key(device, optimize="none"):
+        """模型在注册表中的标识"""
+        return f"image_comparator:{device}:{optimize}"
 
-    def _load_model(self):
+    @staticmethod
+    def _load_model(device, optimize="none"):
+        configure_threads()
         # 直接使用 torchvision 中的 resnet18 模型定义
         model = resnet18(weights=ResNet18_Weights.DEFAULT)
         # 修改全连接层
@@ -20,11 +202,17 @@ class ImageComparator:
         nn.init.xavier_uniform_(model.fc.weight)
         nn.init.constant_(model.fc.bias, 0)
 
-        model.to(self.device)
+        model.to(device)
         model.eval()
-        return model
+        return optimize_model(model, optimize, device, torch.zeros(1, 3, 224, 224))
 
-    def structural_compare(self, img1, img2):
+    def structural_compare(self, img1, img2, tiled=False):
+        if tiled:
+            return self.tiled_score(img1, img2)[1]
+        return self.structural_score(img1, img2)[1]
+
+    def structural_score(self, img1, img2):
+        """计算结构相似度，返回 (相似度得分, uint8 相似度图)"""
 
         # 确保图像尺寸至少为 7x7
         min_side = min(img1.shape[0], img1.shape[1])
@@ -45,13 +233,106 @@ class ImageComparator:
             win_size=win_size,
             channel_axis=2,  # 设置颜色通道轴为第 3 维
         )
-        return (diff * 255).astype("uint8")
+        return score, (diff * 255).astype("uint8")
+
+    def tiled_score(
+        self,
+        img1,
+        img2,
+        scale=PYRAMID_SCALE,
+        tile_size=TILE_SIZE,
+        win_size=7,
+    ):
+        """由粗到细的灰度 SSIM，返回 (相似度得分, uint8 相似度图, 差异区域列表)
+
+        先在降采样层上计算 SSIM，疑似有差异的分块及其相邻一圈分块在全分辨率下复算
+        （SSIM 窗口跨越分块边界，改动会影响相邻分块边缘的像素）；复算时向外扩展一个
+        窗口，结果与整页全分辨率 SSIM 一致。其余分块沿用降采样层的结果，过于细微、
+        在降采样层上察觉不到的改动可能因此漏检。完全相同的页面直接返回，不做任何
+        SSIM 计算。
+        """
+        gray1, gray2 = to_gray(img1), to_gray(img2)
+        height, width = gray1.shape
+        if min(height, width) < win_size:
+            raise ValueError(
+                "图像尺寸过小，无法进行结构相似性计算。请确保图像尺寸至少为 7x7。"
+            )
+        if np.array_equal(gray1, gray2):
+            return 1.0, np.full((height, width), 255, np.uint8), []
+
+        coarse_size = (width // scale, height // scale)
+        if min(coarse_size) < win_size or max(height, width) <= tile_size:
+            mask = _to_mask(ssim_map(gray1, gray2, win_size))
+            return float(mask.mean()) / 255, mask, diff_regions(mask)
+
+        small1 = cv2.resize(gray1, coarse_size, interpolation=cv2.INTER_AREA)
+        small2 = cv2.resize(gray2, coarse_size, interpolation=cv2.INTER_AREA)
+        coarse = ssim_map(small1, small2, win_size)
+        coarse_diff = cv2.absdiff(small1, small2)
+        # 未复算的分块使用降采样层的相似度
+        mask = cv2.resize(
+            _to_mask(coarse), (width, height), interpolation=cv2.INTER_NEAREST
+        )
+
+        rows, cols = -(-height // tile_size), -(-width // tile_size)
+        flagged = np.zeros((rows, cols), np.uint8)
+        for row in range(rows):
+            y0, y1 = row * tile_size, min((row + 1) * tile_size, height)
+            cy0, cy1 = y0 // scale, max(y0 // scale + 1, -(-y1 // scale))
+            for col in range(cols):
+                x0, x1 = col * tile_size, min((col + 1) * tile_size, width)
+                cx0, cx1 = x0 // scale, max(x0 // scale + 1, -(-x1 // scale))
+                region = coarse[cy0:cy1, cx0:cx1]
+                flagged[row, col] = not (
+                    region.size
+                    and region.min() >= COARSE_SSIM
+                    and coarse_diff[cy0:cy1, cx0:cx1].max() <= COARSE_DIFF
+                )
+        # 复算范围扩展到相邻一圈分块，覆盖跨越分块边界的 SSIM 窗口
+        refine = cv2.dilate(flagged, np.ones((3, 3), np.uint8))
+
+        pad = win_size
+        for row, col in zip(*np.nonzero(refine)):
+            y0, y1 = row * tile_size, min((row + 1) * tile_size, height)
+            x0, x1 = col * tile_size, min((col + 1) * tile_size, width)
+            # 向外扩展一个窗口再计算，避免分块边界处的边缘效应
+            py0, px0 = max(y0 - pad, 0), max(x0 - pad, 0)
+            py1, px1 = min(y1 + pad, height), min(x1 + pad, width)
+            tile1, tile2 = gray1[py0:py1, px0:px1], gray2[py0:py1, px0:px1]
+            if np.array_equal(tile1, tile2):
+                # 扩展范围内完全相同时分块内的 SSIM 恒为 1
+                mask[y0:y1, x0:x1] = 255
+                continue
+            tile = ssim_map(tile1, tile2, win_size)
+            mask[y0:y1, x0:x1] = _to_mask(
+                tile[y0 - py0 : y1 - py0, x0 - px0 : x1 - px0]
+            )
+
+        return float(mask.mean()) / 255, mask, diff_regions(mask)
 
     def deep_compare(self, tensor1, tensor2):
-        with torch.no_grad():
-            diff = torch.abs(tensor1 - tensor2)
-            output = self.model(diff.to(self.device))
-            return output.sigmoid().item()
+        return self.deep_compare_batch([tensor1], [tensor2])[0]
+
+    def deep_compare_batch(self, tensors1, tensors2):
+        """批量深度比较：N 个页对返回 N 个差异得分
+
+        参数：
+        tensors1, tensors2: 一一对应的页面张量序列，或形状为 (N, C, H, W) 的批次
+        """
+        diffs = [torch.abs(t1 - t2) for t1, t2 in zip(tensors1, tensors2)]
+        output = batched_forward(self.model, diffs, self.device, self.batch_size)
+        return output.sigmoid().flatten().tolist()
+
+
+# 注册默认模型，供启动时预热
+registry.register(
+    ImageComparator.model_key(torch.device(DEFAULT_DEVICE), default_optimization()),
+    partial(
+        ImageComparator._load_model,
+        torch.device(DEFAULT_DEVICE),
+        default_optimization(),
+    ),
+)
 
 
 if __name__ == "__main__":
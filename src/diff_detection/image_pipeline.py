@@ -0,0 +1,254 @@
+# image_pipeline.py
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from ..pdf_processing.document_cache import load_document
+from ..pdf_processing.fingerprint import new_page_stats, pages_identical
+from ..pdf_processing.image_processor import ImageProcessor, raster_cache
+from ..utils.executors import submit
+from ..utils.instrumentation import span
+from ..utils.progress import checkpoint
+from .image_diff import ImageComparator
+from .page_align import align_pages
+
+# 局部 SSIM 低于该值的像素视为差异像素
+CHANGED_PIXEL_SSIM = 0.8
+# 差异像素占比超过该值的页面视为有差异（整页平均 SSIM 对局部改动不敏感）
+CHANGED_PIXEL_RATIO = 1e-4
+# 连续页对每段一次渲染的页数
+RENDER_WINDOW = 4
+
+
+def _render_run(processor, pdf_path, first, count):
+    """逐页产出一段连续页面的渲染结果（页码从 0 开始）
+
+    固定在 raster_cache 中的文件（一对多比较的基线）逐页取共享的渲染结果，
+    其余文件按窗口一次渲染整段，poppler 的启动开销由整段页面分摊。
+    """
+    if raster_cache.is_pinned(pdf_path):
+        return (processor.render_page(pdf_path, first + i + 1) for i in range(count))
+    return processor.iter_pages(pdf_path, first + 1, first + count)
+
+
+def compare_run(
+    pdf_path1,
+    pdf_path2,
+    run,
+    dpi=200,
+    changed_ratio=CHANGED_PIXEL_RATIO,
+    keep_masks=False,
+):
+    """渲染并比较一段页对，run 中的页码在两个文件中都连续（页码从 0 开始）
+
+    模块级函数，便于提交到进程池执行。
+    """
+    processor = ImageProcessor(dpi=dpi, window=len(run))
+    images1 = _render_run(processor, pdf_path1, run[0][0], len(run))
+    images2 = _render_run(processor, pdf_path2, run[0][1], len(run))
+    results = []
+    for page1, page2 in run:
+        with span("image.page", page1=page1, page2=page2) as page_span:
+            # 每段的第一页触发整段渲染，其余页面直接取用
+            with span("render", dpi=dpi):
+                img1 = np.array(next(images1))
+                img2 = np.array(next(images2))
+            results.append(
+                _compare_images(
+                    img1, img2, page1, page2, changed_ratio, keep_masks, page_span
+                )
+            )
+    return results
+
+
+def compare_page(
+    pdf_path1,
+    pdf_path2,
+    page1,
+    page2,
+    dpi=200,
+    changed_ratio=CHANGED_PIXEL_RATIO,
+    keep_masks=False,
+):
+    """渲染并比较一个页对（页码从 0 开始）"""
+    return compare_run(
+        pdf_path1, pdf_path2, [(page1, page2)], dpi, changed_ratio, keep_masks
+    )[0]
+
+
+def _compare_images(img1, img2, page1, page2, changed_ratio, keep_masks, page_span):
+    if img1.shape != img2.shape:
+        # 页面尺寸不一致时按原始文件尺寸对齐
+        img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
+    # 由粗到细的分块 SSIM：未改动的区域只在降采样层上计算
+    with span("ssim", pixels=img1.shape[0] * img1.shape[1]):
+        score, mask, regions = ImageComparator().tiled_score(img1, img2)
+    ratio = float(np.mean(mask < CHANGED_PIXEL_SSIM * 255))
+    # 去噪后没有留下差异区域的页面（如扫描噪点）不视为有差异
+    changed = ratio > changed_ratio and bool(regions)
+    page_span.set(changed=changed, regions=len(regions))
+    return {
+        "page1": page1,
+        "page2": page2,
+        "status": "changed" if changed else "unchanged",
+        "score": float(score),
+        "changed_ratio": ratio,
+        "diff": mask if changed and keep_masks else None,
+        "regions": regions if changed else [],
+        "size": (img1.shape[1], img1.shape[0]),  # 区域坐标所在的渲染图像 (宽, 高)
+    }
+
+
+def split_runs(jobs, window):
+    """将待比较的页对按两侧页码都连续的段切分，每段最多 window 个页对
+
+    jobs 为 (结果下标, page1, page2)，返回 [(下标列表, 页对列表), ...]
+    """
+    runs = []
+    for index, page1, page2 in jobs:
+        if runs:
+            indexes, pairs = runs[-1]
+            last1, last2 = pairs[-1]
+            if len(pairs) < window and (page1, page2) == (last1 + 1, last2 + 1):
+                indexes.append(index)
+                pairs.append((page1, page2))
+                continue
+        runs.append(([index], [(page1, page2)]))
+    return runs
+
+
+class ImageDiffPipeline:
+    """多页图像差异比较流水线
+
+    对齐两个文档的页面后，对每个匹配且指纹不同的页对并行执行
+    渲染、预处理与 SSIM 比较，按页返回结果并汇总有差异的页面。
+    两侧页码都连续的页对按窗口成段提交，每段的页面一次渲染。
+
+    参数：
+    dpi (int): 渲染分辨率 (默认: 200)
+    max_workers (int): 同时在途的段数 (默认: CPU 核数)
+    window (int): 每段最多的页对数量 (默认: 4)；页对较少时缩小窗口以保持并行度，
+                  同时驻留内存的页面最多为 max_workers × window × 2
+    changed_ratio (float): 判定页面有差异的差异像素占比 (默认: 1e-4)
+    keep_masks (bool): 是否在结果中保留有差异页面的全分辨率相似度图 (默认: False)；
+                       结果会被任务队列与结果缓存保留，只在需要展示掩膜时开启
+    executor (Executor): 执行页对比较的执行器，默认创建大小为 max_workers 的线程池
+    """
+
+    def __init__(
+        self,
+        dpi=200,
+        max_workers=None,
+        changed_ratio=CHANGED_PIXEL_RATIO,
+        keep_masks=False,
+        executor=None,
+        window=RENDER_WINDOW,
+    ):
+        self.dpi = dpi
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.window = window
+        self.changed_ratio = changed_ratio
+        self.keep_masks = keep_masks
+        self.executor = executor
+
+    def compare(self, pdf_path1, pdf_path2, pairs=None):
+        """比较两个图像型PDF的所有页面
+
+        参数：
+        pairs: 仅比较这些已对齐的页对（混合文档中分派给图像引擎的部分）
+
+        返回：
+        dict: pages 为按对齐顺序排列的逐页结果，summary 为差异汇总，
+              page_stats 为页面比较/跳过统计
+        """
+        doc1, doc2 = load_document(pdf_path1), load_document(pdf_path2)
+        page_stats = new_page_stats()
+        pages = []
+        jobs = []
+        if pairs is None:
+            pairs = align_pages(doc1.fingerprints, doc2.fingerprints)
+        for page1, page2 in pairs:
+            page_stats["total"] += 1
+            entry = {
+                "page1": page1,
+                "page2": page2,
+                "score": None,
+                "changed_ratio": None,
+                "diff": None,
+                "regions": [],
+                "size": None,
+            }
+            if page1 is None:
+                page_stats["inserted"] += 1
+                entry["status"] = "inserted"
+            elif page2 is None:
+                page_stats["deleted"] += 1
+                entry["status"] = "deleted"
+            elif pages_identical(doc1.fingerprints[page1], doc2.fingerprints[page2]):
+                page_stats["skipped"] += 1
+                entry["status"] = "identical"
+            else:
+                page_stats["compared"] += 1
+                jobs.append((len(pages), page1, page2))
+            pages.append(entry)
+
+        # 连续的页对按窗口成段渲染；限制同时在途的段数，
+        # 内存占用取决于并行度与窗口大小而非文档页数
+        pool = self.executor or ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = {}
+        completed = 0
+
+        def collect(future):
+            nonlocal completed
+            for index, result in zip(pending.pop(future), future.result()):
+                pages[index] = result
+                completed += 1
+
+        # 页对较少时缩小窗口，保证段数不少于并行度
+        window = max(1, min(self.window, -(-len(jobs) // self.max_workers)))
+        try:
+            for indexes, run in split_runs(jobs, window):
+                # 段边界：任务已取消时不再提交新的页对
+                checkpoint("image", completed, len(jobs))
+                if len(pending) >= self.max_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                future = submit(
+                    pool,
+                    compare_run,
+                    pdf_path1,
+                    pdf_path2,
+                    run,
+                    self.dpi,
+                    self.changed_ratio,
+                    self.keep_masks,
+                )
+                pending[future] = indexes
+            while pending:
+                collect(next(iter(pending)))
+                checkpoint("image", completed, len(jobs))
+        finally:
+            # 出错或取消时丢弃尚未开始的页对
+            for future in pending:
+                future.cancel()
+            if self.executor is None:
+                pool.shutdown()
+
+        return {
+            "pages": pages,
+            "summary": summarize_pages(pages),
+            "page_stats": page_stats,
+        }
+
+
+def summarize_pages(pages):
+    """汇总逐页结果：各状态的页数以及有差异页面的 (page1, page2) 页码对"""
+    summary = {"changed": 0, "inserted": 0, "deleted": 0, "changed_pages": []}
+    for page in pages:
+        if page["status"] in summary:
+            summary[page["status"]] += 1
+            summary["changed_pages"].append((page["page1"], page["page2"]))
+    return summary
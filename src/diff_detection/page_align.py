@@ -0,0 +1,194 @@
+# page_align.py
+"""页面序列对齐
+
+在页面指纹序列上运行序列差异算法，识别插入、删除与匹配的页面，
+避免一页插入导致其后所有页面错位比较。
+"""
+
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import List, Optional, Sequence, Tuple
+
+from ..pdf_processing.fingerprint import PHASH_SIZE, PageFingerprint, page_similarity
+from .text_diff import get_opcodes
+
+# 修改块内两页相似度不低于该值时视为同一页的修订版
+MIN_PAGE_SIMILARITY = 0.3
+# 修改块不超过该规模时直接做相似度动态规划，更大的块先用近似匹配页切分
+MAX_BLOCK_CELLS = 10000
+# 感知哈希按该位宽分段建立 LSH 桶
+PHASH_BAND_BITS = 16
+# 出现在过多页面中的签名值（页眉、模板文字）不参与候选计数
+MAX_BUCKET_PAGES = 16
+# 每页只对共享签名最多的前几个候选计算相似度
+MAX_CANDIDATES = 4
+
+PagePair = Tuple[Optional[int], Optional[int]]
+
+
+def _lsh_tokens(fp: PageFingerprint) -> list:
+    """页面的 LSH 桶键：图像页为感知哈希的分段，文本页为 bottom-k 签名中的哈希值"""
+    if fp.phash is not None:
+        mask = (1 << PHASH_BAND_BITS) - 1
+        return [
+            ("phash", band, (fp.phash >> shift) & mask)
+            for band, shift in enumerate(
+                range(0, PHASH_SIZE * PHASH_SIZE, PHASH_BAND_BITS)
+            )
+        ]
+    return [("text", value) for value in fp.signature]
+
+
+def _near_anchors(fps1, fps2, i1, i2, j1, j2, min_similarity) -> List[PagePair]:
+    """在修改块内寻找互为最相似的页对作为锚点
+
+    两侧页面按 LSH 桶键分桶，只对共享桶最多的少数候选计算相似度，
+    保留互为最佳匹配的页对，再取页码同时递增的最长锚点链。
+    """
+    buckets = defaultdict(list)
+    for b in range(j1, j2):
+        for token in _lsh_tokens(fps2[b]):
+            buckets[token].append(b)
+
+    best1, best2 = {}, {}
+    for a in range(i1, i2):
+        counts = Counter()
+        for token in _lsh_tokens(fps1[a]):
+            pages = buckets.get(token, ())
+            if len(pages) <= MAX_BUCKET_PAGES:
+                counts.update(pages)
+        for b, _ in counts.most_common(MAX_CANDIDATES):
+            s = page_similarity(fps1[a], fps2[b])
+            if s < min_similarity:
+                continue
+            if s > best1.get(a, (None, 0.0))[1]:
+                best1[a] = (b, s)
+            if s > best2.get(b, (None, 0.0))[1]:
+                best2[b] = (a, s)
+    matches = [(a, b) for a, (b, _) in sorted(best1.items()) if best2[b][0] == a]
+
+    # 最长递增子序列：保留页码在两侧都单调递增的锚点
+    tails, tail_index, previous = [], [], [None] * len(matches)
+    for k, (_, b) in enumerate(matches):
+        pos = bisect_left(tails, b)
+        if pos == len(tails):
+            tails.append(b)
+            tail_index.append(k)
+        else:
+            tails[pos] = b
+            tail_index[pos] = k
+        previous[k] = tail_index[pos - 1] if pos else None
+    chain = []
+    k = tail_index[-1] if tail_index else None
+    while k is not None:
+        chain.append(matches[k])
+        k = previous[k]
+    chain.reverse()
+    return chain
+
+
+def _align_block(fps1, fps2, i1, i2, j1, j2, min_similarity) -> List[PagePair]:
+    """在修改块内按相似度对齐页面（未配对的页面视为插入或删除）
+
+    小块直接做全局动态规划；大块先以近似匹配页为锚点切分，再递归对齐锚点之间的
+    区间，找不到锚点时才按位置顺序配对。
+    """
+    n, m = i2 - i1, j2 - j1
+    if n * m <= MAX_BLOCK_CELLS:
+        return _align_dp(fps1, fps2, i1, i2, j1, j2, min_similarity)
+
+    anchors = _near_anchors(fps1, fps2, i1, i2, j1, j2, min_similarity)
+    if not anchors:
+        pairs = [(i1 + k, j1 + k) for k in range(min(n, m))]
+        pairs += [(i1 + k, None) for k in range(m, n)]
+        pairs += [(None, j1 + k) for k in range(n, m)]
+        return pairs
+
+    pairs: List[PagePair] = []
+    a, b = i1, j1
+    for anchor1, anchor2 in anchors:
+        pairs.extend(_align_block(fps1, fps2, a, anchor1, b, anchor2, min_similarity))
+        pairs.append((anchor1, anchor2))
+        a, b = anchor1 + 1, anchor2 + 1
+    pairs.extend(_align_block(fps1, fps2, a, i2, b, j2, min_similarity))
+    return pairs
+
+
+def _align_dp(fps1, fps2, i1, i2, j1, j2, min_similarity) -> List[PagePair]:
+    """在修改块内按相似度做全局对齐"""
+    n, m = i2 - i1, j2 - j1
+    sim = [
+        [page_similarity(fps1[i1 + a], fps2[j1 + b]) for b in range(m)]
+        for a in range(n)
+    ]
+    # score[a][b]: 前 a 页与前 b 页对齐时的最大相似度之和
+    score = [[0.0] * (m + 1) for _ in range(n + 1)]
+    for a in range(1, n + 1):
+        for b in range(1, m + 1):
+            best = max(score[a - 1][b], score[a][b - 1])
+            s = sim[a - 1][b - 1]
+            if s >= min_similarity:
+                best = max(best, score[a - 1][b - 1] + s)
+            score[a][b] = best
+
+    pairs: List[PagePair] = []
+    a, b = n, m
+    while a > 0 and b > 0:
+        s = sim[a - 1][b - 1]
+        if s >= min_similarity and score[a][b] == score[a - 1][b - 1] + s:
+            pairs.append((i1 + a - 1, j1 + b - 1))
+            a, b = a - 1, b - 1
+        elif score[a][b] == score[a - 1][b]:
+            pairs.append((i1 + a - 1, None))
+            a -= 1
+        else:
+            pairs.append((None, j1 + b - 1))
+            b -= 1
+    pairs += [(i1 + k, None) for k in range(a - 1, -1, -1)]
+    pairs += [(None, j1 + k) for k in range(b - 1, -1, -1)]
+    pairs.reverse()
+    return pairs
+
+
+def align_pages(
+    fps1: Sequence[PageFingerprint],
+    fps2: Sequence[PageFingerprint],
+    min_similarity: float = MIN_PAGE_SIMILARITY,
+) -> List[PagePair]:
+    """对齐两个文档的页面序列
+
+    参数：
+    fps1, fps2: 两个文档的页面指纹
+    min_similarity: 修改块内配对页面的最低相似度
+
+    返回：
+    list: (page1, page2) 页码对；page1 为 None 表示插入页，page2 为 None 表示删除页
+    """
+    keys1 = [fp.key for fp in fps1]
+    keys2 = [fp.key for fp in fps2]
+    pairs: List[PagePair] = []
+    for tag, i1, i2, j1, j2 in get_opcodes(keys1, keys2, engine="patience"):
+        if tag == "equal":
+            pairs.extend(zip(range(i1, i2), range(j1, j2)))
+        elif tag == "delete":
+            pairs.extend((i, None) for i in range(i1, i2))
+        elif tag == "insert":
+            pairs.extend((None, j) for j in range(j1, j2))
+        else:
+            pairs.extend(_align_block(fps1, fps2, i1, i2, j1, j2, min_similarity))
+    return pairs
+
+
+def route_pairs(pairs: Sequence[PagePair], types1: dict, types2: dict) -> dict:
+    """按页面类型将页对分派到文本或图像比较引擎
+
+    任一侧为图像页的页对交给图像引擎，其余交给文本引擎。
+
+    返回：
+    dict: {"text": [...], "image": [...]} 两组页对
+    """
+    routes = {"text": [], "image": []}
+    for page1, page2 in pairs:
+        kinds = {types1.get(page1), types2.get(page2)}
+        routes["image" if "image" in kinds else "text"].append((page1, page2))
+    return routes
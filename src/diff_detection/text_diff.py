@@ -0,0 +1,339 @@
+# text_diff.py
+"""行级文本差异引擎
+
+提供三种可选引擎：
+- ndiff：difflib.ndiff，带模糊行内匹配，适合小文档
+- myers：线性空间 Myers O(ND) 算法（中间蛇分治）
+- patience：以两侧唯一行为锚点的 patience diff，锚点之间回退到 Myers
+
+myers 与 patience 均在整数化的行（相同行映射到同一个整数ID）上运行，
+行内细化仅对成对出现的修改行执行。
+"""
+
+from difflib import SequenceMatcher, ndiff
+from typing import Dict, List, Sequence, Tuple
+
+ENGINES = ("ndiff", "myers", "patience")
+
+# 自动选择引擎时，不超过该行数的文档仍使用 ndiff
+NDIFF_MAX_LINES = 2000
+# 超过该长度的修改行不做行内细化
+INTRALINE_MAX_CHARS = 2000
+
+Opcode = Tuple[str, int, int, int, int]
+
+
+def intern_lines(
+    lines1: Sequence[str], lines2: Sequence[str]
+) -> Tuple[List[int], List[int]]:
+    """将两侧的行映射为整数ID，相同内容的行ID相同"""
+    table: Dict[str, int] = {}
+    ids1 = [table.setdefault(line, len(table)) for line in lines1]
+    ids2 = [table.setdefault(line, len(table)) for line in lines2]
+    return ids1, ids2
+
+
+def _middle_snake(a, b, alo, ahi, blo, bhi):
+    """查找 D-path 的中间蛇，返回蛇的起止坐标 (x0, y0, x1, y1)"""
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    vf = [0] * (2 * max_d + 3)
+    vb = [0] * (2 * max_d + 3)
+
+    for d in range(max_d + 1):
+        # 正向搜索
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[offset + k - 1] < vf[offset + k + 1]):
+                x = vf[offset + k + 1]
+            else:
+                x = vf[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            vf[offset + k] = x
+            if odd and delta - (d - 1) <= k <= delta + (d - 1):
+                if x + vb[offset + delta - k] >= n:
+                    return x0, y0, x, y
+
+        # 反向搜索（在倒序坐标中进行）
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[offset + k - 1] < vb[offset + k + 1]):
+                x = vb[offset + k + 1]
+            else:
+                x = vb[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            vb[offset + k] = x
+            if not odd and -d <= delta - k <= d:
+                if x + vf[offset + delta - k] >= n:
+                    return n - x, m - y, n - x0, m - y0
+
+    return None
+
+
+def _myers_matches(a, b, alo, ahi, blo, bhi, matches):
+    """在 a[alo:ahi] 与 b[blo:bhi] 上运行线性空间 Myers 算法，收集匹配行"""
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+
+        # 去除公共前缀与后缀
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+
+        snake = _middle_snake(a, b, alo, ahi, blo, bhi)
+        if snake is None:
+            continue
+        x0, y0, x1, y1 = snake
+        for offset in range(x1 - x0):
+            matches.append((alo + x0 + offset, blo + y0 + offset))
+        if (x0, y0) == (0, 0) and (x1, y1) == (ahi - alo, bhi - blo):
+            continue
+        stack.append((alo, alo + x0, blo, blo + y0))
+        stack.append((alo + x1, ahi, blo + y1, bhi))
+
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    """找出在两侧区间内都只出现一次的行，并按最长递增子序列筛选锚点"""
+    counts: Dict[int, List[int]] = {}
+    for i in range(alo, ahi):
+        entry = counts.setdefault(a[i], [0, 0, i, 0])
+        entry[0] += 1
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[1] += 1
+            entry[3] = j
+
+    pairs = sorted(
+        (entry[2], entry[3])
+        for entry in counts.values()
+        if entry[0] == 1 and entry[1] == 1
+    )
+    if not pairs:
+        return []
+
+    # patience sorting 求 b 下标的最长递增子序列
+    tails: List[int] = []
+    tail_ids: List[int] = []
+    prev = [-1] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < j:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo > 0:
+            prev[idx] = tail_ids[lo - 1]
+        if lo == len(tails):
+            tails.append(j)
+            tail_ids.append(idx)
+        else:
+            tails[lo] = j
+            tail_ids[lo] = idx
+
+    anchors = []
+    idx = tail_ids[-1]
+    while idx != -1:
+        anchors.append(pairs[idx])
+        idx = prev[idx]
+    anchors.reverse()
+    return anchors
+
+
+def _patience_matches(a, b, alo, ahi, blo, bhi, matches):
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        if not anchors:
+            # 无唯一锚点时回退到 Myers
+            _myers_matches(a, b, alo, ahi, blo, bhi, matches)
+            continue
+
+        prev_i, prev_j = alo, blo
+        for i, j in anchors:
+            matches.append((i, j))
+            stack.append((prev_i, i, prev_j, j))
+            prev_i, prev_j = i + 1, j + 1
+        stack.append((prev_i, ahi, prev_j, bhi))
+
+
+def _gap_opcode(i1, i2, j1, j2) -> Opcode:
+    if i2 > i1 and j2 > j1:
+        return ("replace", i1, i2, j1, j2)
+    if i2 > i1:
+        return ("delete", i1, i2, j1, j2)
+    return ("insert", i1, i2, j1, j2)
+
+
+def _matches_to_opcodes(matches, n, m) -> List[Opcode]:
+    """将匹配行转换为与 SequenceMatcher.get_opcodes 相同格式的操作码"""
+    opcodes = []
+    i = j = 0
+    for mi, mj in sorted(matches):
+        if mi > i or mj > j:
+            opcodes.append(_gap_opcode(i, mi, j, mj))
+        last = opcodes[-1] if opcodes else None
+        if last is not None and last[0] == "equal" and last[2] == mi and last[4] == mj:
+            opcodes[-1] = ("equal", last[1], mi + 1, last[3], mj + 1)
+        else:
+            opcodes.append(("equal", mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    if i < n or j < m:
+        opcodes.append(_gap_opcode(i, n, j, m))
+    return opcodes
+
+
+def get_opcodes(
+    lines1: Sequence[str], lines2: Sequence[str], engine: str = "patience"
+) -> List[Opcode]:
+    """计算两组行（或单词）的差异操作码
+
+    参数：
+    lines1, lines2: 待比较的行或单词
+    engine: 'ndiff'（difflib.SequenceMatcher）、'myers' 或 'patience'
+
+    返回：
+    list: (tag, i1, i2, j1, j2) 操作码列表，tag 取值同 difflib
+    """
+    a, b = intern_lines(lines1, lines2)
+    matches: List[Tuple[int, int]] = []
+    if engine == "myers":
+        _myers_matches(a, b, 0, len(a), 0, len(b), matches)
+    elif engine == "patience":
+        _patience_matches(a, b, 0, len(a), 0, len(b), matches)
+    elif engine == "ndiff":
+        return SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+    else:
+        raise ValueError(f"不支持的差异引擎: {engine}")
+    return _matches_to_opcodes(matches, len(a), len(b))
+
+
+def changed_runs(opcodes: Sequence[Opcode]):
+    """将操作码展开为变更片段：("removed", i1, i2) 与 ("added", j1, j2)"""
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            continue
+        if i2 > i1:
+            yield "removed", i1, i2
+        if j2 > j1:
+            yield "added", j1, j2
+
+
+def select_engine(n_lines: int, ndiff_max_lines: int = NDIFF_MAX_LINES) -> str:
+    """按文档规模选择引擎：小文档使用 ndiff，大文档使用 patience"""
+    return "ndiff" if n_lines <= ndiff_max_lines else "patience"
+
+
+def _intraline_spans(line1: str, line2: str):
+    """计算一对修改行中被删除/新增的字符区间"""
+    if len(line1) > INTRALINE_MAX_CHARS or len(line2) > INTRALINE_MAX_CHARS:
+        return [(0, len(line1))], [(0, len(line2))]
+    removed, added = [], []
+    matcher = SequenceMatcher(None, line1, line2, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if i2 > i1:
+            removed.append((i1, i2))
+        if j2 > j1:
+            added.append((j1, j2))
+    return removed, added
+
+
+def _ndiff_lines(lines1, lines2):
+    results = []
+    for line in ndiff(lines1, lines2):
+        code = line[0]
+        if code in (" ", "?"):  # 忽略相同行与行内提示行
+            continue
+        results.append(
+            {
+                "type": "added" if code == "+" else "removed",
+                "content": line[2:],
+                "position": None,
+            }
+        )
+    return results
+
+
+def diff_lines(
+    lines1: Sequence[str],
+    lines2: Sequence[str],
+    engine: str = "patience",
+    intraline: bool = True,
+) -> List[dict]:
+    """比较两组行，返回 {"type", "content", "position"} 格式的差异列表
+
+    参数：
+    lines1, lines2: 待比较的行
+    engine: 'ndiff'、'myers' 或 'patience'
+    intraline: 是否对成对的修改行做行内细化，结果写入 "spans" 字段
+
+    返回：
+    list: 差异条目列表
+    """
+    if engine == "ndiff":
+        return _ndiff_lines(lines1, lines2)
+
+    results = []
+    for tag, i1, i2, j1, j2 in get_opcodes(lines1, lines2, engine):
+        if tag == "equal":
+            continue
+        removed = [
+            {"type": "removed", "content": lines1[i], "position": None}
+            for i in range(i1, i2)
+        ]
+        added = [
+            {"type": "added", "content": lines2[j], "position": None}
+            for j in range(j1, j2)
+        ]
+        if intraline and tag == "replace":
+            # 仅对成对出现的修改行做字符级细化
+            for old, new in zip(removed, added):
+                old["spans"], new["spans"] = _intraline_spans(
+                    old["content"], new["content"]
+                )
+        results.extend(removed)
+        results.extend(added)
+    return results
+
+
+if __name__ == "__main__":
+    # 测试代码
+    old = ["a", "b", "c", "d", "e"]
+    new = ["a", "x", "c", "d", "f", "e"]
+    for name in ENGINES:
+        print(name, diff_lines(old, new, engine=name))
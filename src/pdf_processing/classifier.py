@@ -1,20 +1,40 @@
 # classifier.py
 import logging
+from functools import partial
 from pathlib import Path
-from typing import Optional, Union
+from typing import Dict, List, Optional, Sequence, Union
 
-import pdfplumber
+import fitz
 import torch
 import torch.nn as nn
 from PIL import Image
 from torchvision import models, transforms
 from torchvision.models import ResNet18_Weights
-from pdf2image import convert_from_path
+
+from ..utils.inference import (
+    batched_forward,
+    configure_threads,
+    default_optimization,
+    optimize_model,
+)
+from ..utils.instrumentation import span
+from ..utils.model_registry import registry
+from .document_cache import load_document
 
 # 配置日志记录
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# 模型输入边长，缩略图按该尺寸计算渲染缩放比例
+INPUT_SIZE = 224
+# 逐页分类时，字符数不少于该值的页面视为有文本
+PAGE_TEXT_CHARS = 100
+# 逐页分类时，图像覆盖率不低于该值的页面视为扫描页
+PAGE_IMAGE_COVERAGE = 0.5
+# 逐页分类时模型一次前向传播的最大页数
+PAGE_BATCH_SIZE = 16
+
 
 class PDFClassifier:
     """PDF文档分类器，用于区分文本型PDF和图像型PDF
@@ -30,6 +50,9 @@ class PDFClassifier:
     model_path (str): 预训练模型路径 (默认: None使用内置模型)
     sample_pages (int): 采样的页面数量 (默认: 5)
     device (str): 计算设备 ('cuda' 或 'cpu') (默认: auto)
+    batch_pages (int): 深度学习阶段一次前向传播的页数，取平均概率 (默认: 1)
+    optimize (str): CPU 推理优化 'none'、'int8' 或 'torchscript'
+                    (默认: PDF_DIFF_MODEL_OPTIMIZE)
     """
 
     def __init__(
@@ -38,17 +61,19 @@ class PDFClassifier:
         model_path: Optional[Union[str, Path]] = None,
         sample_pages: int = 5,
         device: Optional[str] = None,
+        batch_pages: int = 1,
+        optimize: Optional[str] = None,
     ):
         self.text_threshold = text_threshold
+        self.batch_pages = batch_pages
         self.sample_pages = sample_pages
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-
-        # 初始化模型
-        self.model = self._init_model(model_path)
+        self.device = device or DEFAULT_DEVICE
+        self.model_path = model_path
+        self.optimize = optimize or default_optimization()
         self.preprocess = transforms.Compose(
             [
-                transforms.Resize(224),
-                transforms.CenterCrop(224),
+                transforms.Resize(INPUT_SIZE),
+                transforms.CenterCrop(INPUT_SIZE),
                 transforms.ToTensor(),
                 transforms.Normalize(
                     mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]
@@ -56,14 +81,34 @@ class PDFClassifier:
             ]
         )
 
-    def _init_model(self, model_path: Optional[Union[str, Path]]) -> nn.Module:
+    @property
+    def model(self) -> nn.Module:
+        # 从进程级注册表获取模型，同一配置只加载一次；
+        # 启发式即可判定的文档不会触发模型加载
+        return registry.get(
+            self.model_key(self.model_path, self.device, self.optimize),
+            partial(self._init_model, self.model_path, self.device, self.optimize),
+        )
+
+    @staticmethod
+    def model_key(
+        model_path: Optional[Union[str, Path]], device: str, optimize: str = "none"
+    ) -> str:
+        """模型在注册表中的标识"""
+        return f"pdf_classifier:{model_path or 'default'}:{device}:{optimize}"
+
+    @staticmethod
+    def _init_model(
+        model_path: Optional[Union[str, Path]], device: str, optimize: str = "none"
+    ) -> nn.Module:
         """初始化并加载预训练模型"""
+        configure_threads()
         model = models.resnet18(weights=ResNet18_Weights.DEFAULT)
         model.fc = nn.Linear(512, 2)  # 修改最后的全连接层
 
         if model_path:
             try:
-                state_dict = torch.load(model_path, map_location=self.device)
+                state_dict = torch.load(model_path, map_location=device)
                 model.load_state_dict(state_dict)
                 logger.info(f"成功加载自定义模型: {model_path}")
             except Exception as e:
@@ -71,9 +116,10 @@ class PDFClassifier:
         else:
             logger.info("使用未经微调的预训练ResNet18")
 
-        model = model.to(self.device)
+        model = model.to(device)
         model.eval()
-        return model
+        example_input = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE)
+        return optimize_model(model, optimize, device, example_input)
 
     def _is_text_based(self, pdf_path: Union[str, Path]) -> bool:
         """启发式文本检测策略
@@ -85,42 +131,150 @@ class PDFClassifier:
         bool: 如果检测为文本型PDF返回True
         """
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                total_pages = len(pdf.pages)
-                sampled_pages = pdf.pages[: self.sample_pages]
+            # 与文本差异比较共享同一份提取结果
+            document = load_document(pdf_path)
+            sampled_pages = document.load_pages(
+                range(min(self.sample_pages, document.page_count))
+            )
 
-                text_pages = 0
-                for page in sampled_pages:
-                    text = page.extract_text(x_tolerance=1, y_tolerance=1)
-                    if text and len(text.strip()) > 100:  # 排除空白页面
-                        text_pages += 1
+            text_pages = 0
+            for page in sampled_pages:
+                if len(page.text.strip()) > 100:  # 排除空白页面
+                    text_pages += 1
 
-                ratio = text_pages / len(sampled_pages)
-                logger.info(f"文本页面比例: {ratio:.2f}")
-                return ratio >= self.text_threshold
+            ratio = text_pages / len(sampled_pages)
+            logger.info(f"文本页面比例: {ratio:.2f}")
+            return ratio >= self.text_threshold
 
         except Exception as e:
             logger.error(f"文本检测失败: {e}")
             return False
 
+    @staticmethod
+    def _render_thumbnail(page: fitz.Page) -> Image.Image:
+        """以模型输入所需的最低分辨率渲染页面（短边约为 224 像素）"""
+        zoom = INPUT_SIZE / min(page.rect.width, page.rect.height)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+    def _render_batch(self, data: bytes, page_numbers: Sequence[int]) -> torch.Tensor:
+        """将指定页面渲染为缩略图并组成一个批次"""
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            images = [self._render_thumbnail(doc[n]) for n in page_numbers]
+        return torch.stack([self.preprocess(img) for img in images])
+
+    def predict(self, pages: torch.Tensor) -> List[float]:
+        """批量推理：N 页预处理后的缩略图返回 N 个图像型概率"""
+        output = batched_forward(self.model, pages, self.device, PAGE_BATCH_SIZE)
+        return torch.softmax(output, dim=1)[:, 1].tolist()
+
+    def _image_probabilities(
+        self, data: bytes, page_numbers: Sequence[int]
+    ) -> List[float]:
+        """模型判定各页为图像型的概率（按批次渲染，缩略图内存不随页数增长）"""
+        probabilities = []
+        with span("classify.model", pages=len(page_numbers)):
+            for start in range(0, len(page_numbers), PAGE_BATCH_SIZE):
+                batch = self._render_batch(
+                    data, page_numbers[start : start + PAGE_BATCH_SIZE]
+                )
+                probabilities.extend(self.predict(batch))
+        return probabilities
+
+    def image_probabilities(
+        self, pdf_path: Union[str, Path], page_numbers: Optional[Sequence[int]] = None
+    ) -> List[float]:
+        """批量判定指定页面（默认全部页面）为图像型的概率
+
+        参数：
+        pdf_path: PDF文件路径
+        page_numbers: 页码列表（从 0 开始）
+
+        返回：
+        list: 与 page_numbers 一一对应的概率
+        """
+        document = load_document(pdf_path)
+        if page_numbers is None:
+            page_numbers = range(document.page_count)
+        return self._image_probabilities(document.data, list(page_numbers))
+
     def _preprocess_pdf(self, pdf_path: Union[str, Path]) -> torch.Tensor:
-        """预处理PDF文件为模型输入"""
+        """预处理PDF文件为模型输入
+
+        使用 PyMuPDF 在进程内渲染低分辨率缩略图，
+        前 batch_pages 页组成一个批次
+        """
         try:
-            # 转换PDF为图像
-            images = convert_from_path(
-                pdf_path, first_page=1, last_page=1
-            )  # 仅处理第一页
-            if not images:
+            document = load_document(pdf_path)
+            if document.page_count == 0:
                 raise ValueError("无法转换PDF为图像")
-
-            # 预处理图像
-            image_tensor = self.preprocess(images[0]).unsqueeze(0)
-            return image_tensor.to(self.device)
+            pages = range(min(self.batch_pages, document.page_count))
+            return self._render_batch(document.data, pages)
 
         except Exception as e:
             logger.error(f"PDF预处理失败: {e}")
             raise
 
+    @staticmethod
+    def _page_heuristic(fingerprint) -> Optional[str]:
+        """依据字符数与图像覆盖率判定页面类型，无法判定时返回 None
+
+        - 没有图像对象的页面（含空白页）为文本页
+        - 文本层字符足够的页面为文本页，包括带背景图与经过 OCR 的扫描页：
+          文本层可以直接比较，无需光栅化
+        - 没有文本层，或图像覆盖大部分页面且文字很少的页面为扫描页
+        - 只剩少量文字加局部图像的页面交给模型判定
+        """
+        if fingerprint.image_coverage == 0:
+            return "text"
+        if fingerprint.char_count >= PAGE_TEXT_CHARS:
+            return "text"
+        if fingerprint.char_count == 0:
+            return "image"
+        if fingerprint.image_coverage >= PAGE_IMAGE_COVERAGE:
+            return "image"
+        return None
+
+    def classify_pages(self, pdf_path: Union[str, Path]) -> Dict[int, str]:
+        """逐页分类PDF文件
+
+        先用字符数与图像覆盖率等廉价信号判定，仅对无法判定的页面调用模型
+
+        参数：
+        pdf_path: PDF文件路径
+
+        返回：
+        dict: 页码（从 0 开始）到 'text' 或 'image' 的映射
+        """
+        # 同一文档的分类结果保存在提取缓存中（一对多比较时基线只分类一次）
+        document = load_document(pdf_path)
+        key = (
+            "page_types",
+            self.model_key(self.model_path, self.device, self.optimize),
+        )
+        return dict(document.derived(key, partial(self._classify_pages, document)))
+
+    def _classify_pages(self, document) -> Dict[int, str]:
+        page_types = {}
+        ambiguous = []
+        for page_number, fingerprint in enumerate(document.fingerprints):
+            page_type = self._page_heuristic(fingerprint)
+            if page_type is None:
+                ambiguous.append(page_number)
+            else:
+                page_types[page_number] = page_type
+
+        if ambiguous:
+            logger.info(f"模型判定页面: {len(ambiguous)} 页")
+            try:
+                probabilities = self._image_probabilities(document.data, ambiguous)
+            except Exception as e:
+                logger.error(f"逐页分类失败: {e}，默认按image处理")
+                probabilities = [1.0] * len(ambiguous)
+            for page_number, image_prob in zip(ambiguous, probabilities):
+                page_types[page_number] = "image" if image_prob > 0.5 else "text"
+        return page_types
+
     def classify(self, pdf_path: Union[str, Path]) -> str:
         """分类PDF文件类型
 
@@ -138,11 +292,8 @@ class PDFClassifier:
         try:
             # 第二阶段：深度学习验证
             input_tensor = self._preprocess_pdf(pdf_path)
-
-            with torch.no_grad():
-                output = self.model(input_tensor)
-                probabilities = torch.softmax(output, dim=1)
-                image_prob = probabilities[0][1].item()
+            probabilities = self.predict(input_tensor)
+            image_prob = sum(probabilities) / len(probabilities)
 
             logger.info(f"图像型概率: {image_prob:.2f}")
             return "image" if image_prob > 0.5 else "text"
@@ -152,6 +303,13 @@ class PDFClassifier:
             return "image"
 
 
+# 注册默认模型，供启动时预热
+registry.register(
+    PDFClassifier.model_key(None, DEFAULT_DEVICE, default_optimization()),
+    partial(PDFClassifier._init_model, None, DEFAULT_DEVICE, default_optimization()),
+)
+
+
 # 使用示例
 if __name__ == "__main__":
     classifier = PDFClassifier(text_threshold=0.5)
@@ -0,0 +1,214 @@
+# document_cache.py
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Union
+
+import fitz
+
+from .extraction import ExtractionBackend, PageContent, get_extractor
+from .fingerprint import PageFingerprint, fingerprint_document
+from ..utils.instrumentation import span
+from ..utils.progress import checkpoint
+
+logger = logging.getLogger(__name__)
+
+
+def read_source(source) -> Union[str, Path, bytes]:
+    """规范化PDF输入：路径原样返回，其余（bytes、memoryview、文件对象）转换为 bytes"""
+    if isinstance(source, (str, Path, bytes)):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, "getbuffer"):
+        return bytes(source.getbuffer())
+    if hasattr(source, "read"):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return source.read()
+    raise TypeError(f"不支持的PDF输入类型: {type(source).__name__}")
+
+
+class DocumentExtraction:
+    """单个PDF文档的一次性解析结果
+
+    每页最多用提取后端解析一次，同时保存文本与单词，
+    供分类器、文本差异比较和标注阶段共享。页面按需解析，
+    指纹相同而被跳过的页面不会产生解析开销。
+    """
+
+    def __init__(self, digest: str, data: bytes, extractor: ExtractionBackend):
+        self.digest = digest
+        self.data = data
+        self.extractor = extractor
+        self._pages: Dict[int, PageContent] = {}
+        self._page_count = None
+        self._fingerprints = None
+        self._lock = threading.Lock()
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    @property
+    def key(self) -> tuple:
+        return (self.digest, self.extractor.name)
+
+    @property
+    def page_count(self) -> int:
+        if self._page_count is None:
+            with fitz.open(stream=self.data, filetype="pdf") as doc:
+                self._page_count = doc.page_count
+        return self._page_count
+
+    def __len__(self):
+        return self.page_count
+
+    @property
+    def fingerprints(self) -> List[PageFingerprint]:
+        """每页的指纹（首次访问时计算）"""
+        if self._fingerprints is None:
+            with self._lock:
+                if self._fingerprints is None:
+                    with span("fingerprint") as fp_span:
+                        self._fingerprints = fingerprint_document(self.data)
+                        fp_span.set(pages=len(self._fingerprints))
+        return self._fingerprints
+
+    @property
+    def pages(self) -> List[PageContent]:
+        """全部页面的提取结果"""
+        return self.load_pages(range(self.page_count))
+
+    @property
+    def text(self) -> str:
+        """全文文本（忽略空白页）"""
+        return "\n".join(page.text for page in self.pages if page.text)
+
+    def page(self, page_number: int) -> PageContent:
+        return self.load_pages([page_number])[0]
+
+    def load_pages(self, page_numbers: Iterable[int]) -> List[PageContent]:
+        """解析指定页面（已解析的页面直接复用）"""
+        page_numbers = list(page_numbers)
+        with self._lock:
+            missing = [n for n in page_numbers if n not in self._pages]
+            if missing:
+                with span(
+                    "extract", backend=self.extractor.name, pages=len(missing)
+                ), self.extractor.open(self.data) as handle:
+                    for index, page_number in enumerate(missing):
+                        checkpoint("extract", index, len(missing))
+                        self._pages[page_number] = self.extractor.extract_page(
+                            handle, page_number
+                        )
+            return [self._pages[n] for n in page_numbers]
+
+    def derived(self, key: Hashable, compute: Callable[[], object]):
+        """按键缓存由文档派生的结果（如逐页分类），并发请求只计算一次"""
+        with self._derived_lock:
+            if key not in self._derived:
+                self._derived[key] = compute()
+            return self._derived[key]
+
+
+class DocumentCache:
+    """按内容哈希与提取后端索引的文档提取缓存（LRU淘汰）
+
+    参数：
+    max_entries (int): 最多缓存的文档数量 (默认: 8)
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, DocumentExtraction]" = OrderedDict()
+        # (路径, 修改时间, 大小, 后端) -> 缓存键，未修改的文件不再读取与哈希
+        self._paths: Dict[tuple, tuple] = {}
+        self._pinned = Counter()
+        self._lock = threading.Lock()
+
+    def get(self, source, extractor=None) -> DocumentExtraction:
+        """获取文档提取结果，未命中时创建并放入缓存（页面按需解析）
+
+        参数：
+        source: PDF文件路径、内容（bytes/memoryview）或文件对象
+        extractor: 提取后端名称或实例，默认按 PDF_DIFF_EXTRACTOR 选择
+
+        返回：
+        DocumentExtraction: 文档提取结果
+        """
+        extractor = get_extractor(extractor)
+        source = read_source(source)
+        path_key = None
+        if isinstance(source, (str, Path)):
+            stat = os.stat(source)
+            path_key = (os.fspath(source), stat.st_mtime_ns, stat.st_size)
+            path_key += (extractor.name,)
+            with self._lock:
+                document = self._entries.get(self._paths.get(path_key))
+                if document is not None:
+                    self._entries.move_to_end(document.key)
+                    return document
+            with open(source, "rb") as f:
+                data = f.read()
+        else:
+            data = source
+            # 同一个 bytes 对象在各阶段间传递时直接命中，不重复计算哈希
+            with self._lock:
+                for document in self._entries.values():
+                    if document.data is data and document.extractor is extractor:
+                        return document
+        digest = hashlib.sha256(data).hexdigest()
+        key = (digest, extractor.name)
+
+        with self._lock:
+            document = self._entries.get(key)
+            if document is None:
+                logger.info(f"缓存PDF文档: {digest[:12]} ({extractor.name})")
+                document = DocumentExtraction(digest, data, extractor)
+                self._entries[key] = document
+                self._evict()
+            else:
+                self._entries.move_to_end(key)
+            if path_key is not None:
+                self._paths[path_key] = key
+        return document
+
+    def pin(self, source, extractor=None) -> DocumentExtraction:
+        """获取文档并固定在缓存中，unpin 之前不会被淘汰（如一对多比较的基线）"""
+        document = self.get(source, extractor)
+        with self._lock:
+            self._pinned[document.key] += 1
+            self._entries[document.key] = document
+        return document
+
+    def unpin(self, document: DocumentExtraction) -> None:
+        with self._lock:
+            self._pinned[document.key] -= 1
+            if self._pinned[document.key] <= 0:
+                del self._pinned[document.key]
+            self._evict()
+
+    def _evict(self) -> None:
+        # 按最近使用顺序淘汰未固定的文档（调用方持有锁）
+        while len(self._entries) > self.max_entries:
+            key = next((k for k in self._entries if k not in self._pinned), None)
+            if key is None:
+                break
+            del self._entries[key]
+            for path_key in [p for p, k in self._paths.items() if k == key]:
+                del self._paths[path_key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._paths.clear()
+
+
+document_cache = DocumentCache()
+
+
+def load_document(source, extractor=None) -> DocumentExtraction:
+    """从进程级缓存获取文档提取结果"""
+    return document_cache.get(source, extractor)
@@ -0,0 +1,201 @@
+# fingerprint.py
+import hashlib
+from typing import List, Optional
+
+import cv2
+import fitz
+import numpy as np
+
+from ..utils.progress import checkpoint
+
+# 感知哈希边长（16x16 位），边长越大对局部改动越敏感
+PHASH_SIZE = 16
+# 渲染感知哈希缩略图时页面长边的像素数
+PHASH_RENDER_SIDE = 128
+# 文本签名：按词的 shingle 长度与 bottom-k 草图大小
+SHINGLE_SIZE = 3
+SIGNATURE_SIZE = 64
+
+
+class PageFingerprint:
+    """单页指纹
+
+    - digest: 内容流、嵌入图像数据与规范化文本的联合哈希（字节级一致）
+    - text_hash: 规范化文本哈希（文本级一致）
+    - phash: 无文本图像页的感知哈希（按位存储的整数），其余页面为 None
+    - signature: 文本 shingle 的 bottom-k 草图，用于估计页面相似度
+    - char_count: 规范化文本的字符数
+    - image_coverage: 图像对象覆盖页面面积的比例 (0~1)
+    """
+
+    __slots__ = (
+        "digest",
+        "text_hash",
+        "has_text",
+        "has_images",
+        "phash",
+        "signature",
+        "char_count",
+        "image_coverage",
+    )
+
+    def __init__(
+        self,
+        digest,
+        text_hash,
+        has_text,
+        has_images,
+        phash=None,
+        signature=(),
+        char_count=0,
+        image_coverage=0.0,
+    ):
+        self.digest = digest
+        self.text_hash = text_hash
+        self.has_text = has_text
+        self.has_images = has_images
+        self.phash = phash
+        self.signature = signature
+        self.char_count = char_count
+        self.image_coverage = image_coverage
+
+    @property
+    def key(self) -> str:
+        """页面序列对齐使用的键，键相同的页面视为一致"""
+        if self.phash is not None:
+            return f"phash:{self.phash:x}"
+        if self.has_images:
+            return f"digest:{self.digest}"
+        return f"text:{self.text_hash}"
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：合并空白字符"""
+    return " ".join(text.split())
+
+
+def text_signature(text: str, size: int = SIGNATURE_SIZE) -> tuple:
+    """计算文本的 shingle 签名（保留最小的 size 个哈希值）"""
+    words = text.split()
+    if not words:
+        return ()
+    shingles = {
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(max(1, len(words) - SHINGLE_SIZE + 1))
+    }
+    hashes = {
+        int.from_bytes(
+            hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for shingle in shingles
+    }
+    return tuple(sorted(hashes)[:size])
+
+
+def signature_similarity(sig1: tuple, sig2: tuple) -> float:
+    """用 bottom-k 草图估计两页文本的 Jaccard 相似度"""
+    if not sig1 and not sig2:
+        return 1.0
+    if not sig1 or not sig2:
+        return 0.0
+    k = min(len(sig1), len(sig2))
+    both = set(sig1) & set(sig2)
+    union = sorted(set(sig1) | set(sig2))[:k]
+    return sum(1 for h in union if h in both) / len(union)
+
+
+def perceptual_hash(page: fitz.Page, size: int = PHASH_SIZE) -> int:
+    """计算页面的差值感知哈希（dHash）"""
+    scale = PHASH_RENDER_SIDE / max(page.rect.width, page.rect.height)
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    small = cv2.resize(img, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def image_coverage(page: fitz.Page) -> float:
+    """页面中图像对象覆盖的面积比例（重叠部分会重复计算，结果上限为 1）"""
+    page_area = page.rect.width * page.rect.height
+    if page_area <= 0:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"]) & page.rect
+        if not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    return min(1.0, covered / page_area)
+
+
+def fingerprint_page(doc: fitz.Document, page: fitz.Page) -> PageFingerprint:
+    text = normalize_text(page.get_text("text"))
+    text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    digest = hashlib.sha1(page.read_contents())
+    images = page.get_images(full=True)
+    for image in images:
+        # 使用原始（未解码）图像流，开销很小
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    digest.update(text.encode("utf-8"))
+
+    phash = None
+    if images and not text:
+        phash = perceptual_hash(page)
+    return PageFingerprint(
+        digest.hexdigest(),
+        text_hash,
+        bool(text),
+        bool(images),
+        phash,
+        text_signature(text),
+        len(text),
+        image_coverage(page) if images else 0.0,
+    )
+
+
+def fingerprint_document(data: bytes) -> List[PageFingerprint]:
+    """计算文档每一页的指纹"""
+    fingerprints = []
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for page in doc:
+            checkpoint("fingerprint", page.number, doc.page_count)
+            fingerprints.append(fingerprint_page(doc, page))
+    return fingerprints
+
+
+def phash_distance(fp1: PageFingerprint, fp2: PageFingerprint) -> Optional[int]:
+    """两页感知哈希的汉明距离，任一页没有感知哈希时返回 None"""
+    if fp1.phash is None or fp2.phash is None:
+        return None
+    return bin(fp1.phash ^ fp2.phash).count("1")
+
+
+def page_similarity(fp1: PageFingerprint, fp2: PageFingerprint) -> float:
+    """估计两页的相似度 (0~1)：图像页使用感知哈希，其余页面使用文本签名"""
+    if fp1.key == fp2.key:
+        return 1.0
+    distance = phash_distance(fp1, fp2)
+    if distance is not None:
+        return 1.0 - distance / (PHASH_SIZE * PHASH_SIZE)
+    return signature_similarity(fp1.signature, fp2.signature)
+
+
+def pages_identical(fp1: PageFingerprint, fp2: PageFingerprint) -> bool:
+    """判断两页是否无需进入差异比较
+
+    含图像的页面只在字节一致时跳过：感知哈希来自低分辨率缩略图，
+    察觉不到小范围改动，只用于页面对齐与相似度估计。
+
+    返回：
+    bool: 字节一致，或纯文本页文本一致时返回True
+    """
+    if fp1.digest == fp2.digest:
+        return True
+    if fp1.has_images or fp2.has_images:
+        return False
+    return fp1.text_hash == fp2.text_hash
+
+
+def new_page_stats(total: int = 0) -> dict:
+    """页面跳过统计"""
+    return {"total": total, "compared": 0, "skipped": 0, "inserted": 0, "deleted": 0}
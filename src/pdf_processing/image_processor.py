@@ -1,16 +1,134 @@
-from pdf2image import convert_from_path
+import os
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+from pdf2image import (
+    convert_from_bytes,
+    convert_from_path,
+    pdfinfo_from_bytes,
+    pdfinfo_from_path,
+)
 import cv2
 import numpy as np
 import torch
 
 
+class RasterCache:
+    """固定文件的页面渲染缓存
+
+    一对多比较时同一基线页面会被多个任务渲染；固定（pin）基线路径后，
+    每个 (页码, dpi) 只渲染一次，并发请求等待同一次渲染结果。
+    未固定的文件不缓存，unpin 后释放该文件的所有渲染结果。
+    """
+
+    def __init__(self):
+        self._pinned = Counter()
+        self._rasters = {}
+        self._lock = threading.Lock()
+
+    def pin(self, pdf_path) -> None:
+        with self._lock:
+            self._pinned[os.fspath(pdf_path)] += 1
+
+    def is_pinned(self, pdf_path) -> bool:
+        if not isinstance(pdf_path, (str, os.PathLike)):
+            return False
+        with self._lock:
+            return os.fspath(pdf_path) in self._pinned
+
+    def unpin(self, pdf_path) -> None:
+        path = os.fspath(pdf_path)
+        with self._lock:
+            self._pinned[path] -= 1
+            if self._pinned[path] > 0:
+                return
+            del self._pinned[path]
+            for key in [k for k in self._rasters if k[0] == path]:
+                del self._rasters[key]
+
+    def get(self, pdf_path, page_number, dpi, render):
+        """返回缓存的渲染结果，未缓存时调用 render() 渲染"""
+        if not isinstance(pdf_path, (str, os.PathLike)):
+            return render()
+        key = (os.fspath(pdf_path), page_number, dpi)
+        future, owner = None, False
+        with self._lock:
+            if key[0] in self._pinned:
+                future = self._rasters.get(key)
+                if future is None:
+                    future = self._rasters[key] = Future()
+                    owner = True
+        if future is None:
+            return render()
+        if owner:
+            try:
+                future.set_result(render())
+            except BaseException as e:
+                future.set_exception(e)
+                with self._lock:
+                    self._rasters.pop(key, None)
+        return future.result()
+
+
+raster_cache = RasterCache()
+
+
 class ImageProcessor:
-    def __init__(self, dpi=200):
+    """PDF页面光栅化与图像预处理
+
+    参数：
+    dpi (int): 渲染分辨率 (默认: 200)
+    window (int): 每批渲染的页数，决定同时驻留内存的页面数量上限 (默认: 4)
+
+    pdf_path 可以是文件路径或PDF内容（bytes）；按内容渲染时 pdf2image 会为每次调用
+    写出临时文件，多页渲染应先将文件落盘一次再按路径渲染。
+    """
+
+    def __init__(self, dpi=200, window=4):
         self.dpi = dpi
+        self.window = window
+
+    @staticmethod
+    def page_count(pdf_path):
+        if isinstance(pdf_path, (str, os.PathLike)):
+            return int(pdfinfo_from_path(pdf_path)["Pages"])
+        return int(pdfinfo_from_bytes(bytes(pdf_path))["Pages"])
+
+    def iter_pages(self, pdf_path, first_page=1, last_page=None, window=None):
+        """按页范围惰性渲染页面（页码从 1 开始）
+
+        每次只调用 poppler 渲染 window 页，消费完当前批次后才渲染下一批，
+        峰值内存取决于 window 而不是文档页数。
+        """
+        window = window or self.window
+        if last_page is None:
+            last_page = self.page_count(pdf_path)
+        for start in range(first_page, last_page + 1, window):
+            end = min(start + window - 1, last_page)
+            if isinstance(pdf_path, (str, os.PathLike)):
+                batch = convert_from_path(
+                    pdf_path, dpi=self.dpi, first_page=start, last_page=end
+                )
+            else:
+                batch = convert_from_bytes(
+                    bytes(pdf_path), dpi=self.dpi, first_page=start, last_page=end
+                )
+            while batch:
+                yield batch.pop(0)
+
+    def render_page(self, pdf_path, page_number):
+        """渲染单页（页码从 1 开始），固定在 raster_cache 中的文件只渲染一次"""
+        return raster_cache.get(
+            pdf_path,
+            page_number,
+            self.dpi,
+            lambda: next(self.iter_pages(pdf_path, page_number, page_number, window=1)),
+        )
 
     def pdf_to_images(self, pdf_path):
         try:
-            return convert_from_path(pdf_path, dpi=self.dpi)
+            return list(self.iter_pages(pdf_path))
         except Exception as e:
             print(f"PDF to image conversion failed: {e}")
             return []
@@ -1,31 +1,166 @@
+import inspect
+import re
+
 import fitz
-import cv2
-import numpy as np
+
+from .document_cache import load_document
+from ..utils.instrumentation import span
+from ..utils.progress import checkpoint
+
+
+def image_region_marks(regions, size, color):
+    """将图像比较得到的差异区域转换为标注
+
+    参数：
+    regions (list): 差异区域，box 为渲染图像上的像素坐标 (x0, y0, x1, y1)
+    size (tuple): 渲染图像的 (宽, 高)，标注时按页面尺寸缩放
+    color (tuple): 边框颜色 (r, g, b)，取值 0~1
+    """
+    return [{"box": region["box"], "size": size, "color": color} for region in regions]
+
+
+# 序列化选项；PyMuPDF 1.24 起支持对象流（use_objstms），旧版本（如 1.22）没有该参数
+SAVE_OPTIONS = {"garbage": 1, "deflate": True}
+if "use_objstms" in inspect.signature(fitz.Document.save).parameters:
+    SAVE_OPTIONS["use_objstms"] = 1
+
+
+def _numbers(values):
+    return " ".join(f"{v:.2f}" for v in values)
 
 
 class PDFAnnotator:
+    """PDF差异标注
+
+    一次打开文档、逐页写入全部标注，最后一次性序列化为PDF内容（或保存到文件）。
+    标注按页组织，每页可混合两类标注：
+    - 文本差异 {"rects": [fitz.Rect, ...], "color": (r, g, b)}：
+      同一页同一颜色的文本差异合并为一条多区域高亮标注
+    - 图像差异 {"box": (x0, y0, x1, y1), "size": (宽, 高), "color": (r, g, b)}：
+      渲染像素坐标上的矩形，按页面尺寸缩放后绘制为矩形框标注
+
+    标注直接写为PDF对象，不通过 add_*_annot 逐条生成外观流（每条约数毫秒）；
+    没有外观流的高亮与矩形框由阅读器按 QuadPoints / Rect 绘制。
+    PyMuPDF 支持时输出使用对象流压缩，标注数千处差异的耗时与一次保存相当。
+    """
+
+    @staticmethod
+    def annotate(source, page_marks, output_path=None):
+        """在PDF中写入所有页面的差异标注
+
+        参数：
+        source: PDF文件路径或内容
+        page_marks: 页码（从 0 开始）到该页标注列表的映射，或按页排列的列表
+        output_path (str): 保存路径；未指定时返回标注后的PDF内容
+
+        没有任何标注时不重新序列化，直接返回原始内容。
+        """
+        if not isinstance(page_marks, dict):
+            page_marks = dict(enumerate(page_marks))
+        # 复用提取缓存中的文档内容，避免再次读取磁盘
+        data = load_document(source).data
+        pages = sorted(n for n, marks in page_marks.items() if marks)
+        if not pages and output_path is None:
+            return data
+
+        doc = fitz.open(stream=data, filetype="pdf")
+        try:
+            pages = [n for n in pages if n < doc.page_count]
+            with span("annotate", pages=len(pages)):
+                for done, page_num in enumerate(pages):
+                    checkpoint("annotate", done, len(pages))
+                    PDFAnnotator._annotate_page(
+                        doc, doc[page_num], page_marks[page_num]
+                    )
+                if output_path is None:
+                    return doc.tobytes(**SAVE_OPTIONS)
+                doc.save(output_path, **SAVE_OPTIONS)
+        finally:
+            doc.close()
+
+    @staticmethod
+    def _annotate_page(doc, page, marks):
+        # 页面坐标（左上角为原点）到PDF用户空间的变换
+        to_pdf = ~page.transformation_matrix
+        # 图像差异按页面显示方向渲染，需要先去除页面旋转
+        derotate = page.derotation_matrix
+        highlights, objects = {}, []
+        for mark in marks:
+            if "rects" in mark:
+                highlights.setdefault(tuple(mark["color"]), []).extend(mark["rects"])
+            else:
+                objects.append(
+                    PDFAnnotator._box_object(mark, page.rect, derotate * to_pdf)
+                )
+        for color, rects in highlights.items():
+            if rects:
+                objects.append(PDFAnnotator._highlight_object(rects, color, to_pdf))
+
+        refs = []
+        for obj in objects:
+            xref = doc.get_new_xref()
+            doc.update_object(xref, f"<</Type/Annot/P {page.xref} 0 R/F 4{obj}>>")
+            refs.append(f"{xref} 0 R")
+        if refs:
+            refs = PDFAnnotator._existing_annots(doc, page) + refs
+            doc.xref_set_key(page.xref, "Annots", f"[{' '.join(refs)}]")
+
+    @staticmethod
+    def _highlight_object(rects, color, to_pdf):
+        # 坐标变换直接按矩阵系数计算，fitz 的 Quad/Matrix 运算逐点调用开销较大
+        a, b, c, d, e, f = to_pdf
+        quads = []
+        for x0, y0, x1, y1 in rects:
+            # 左上、右上、左下、右下
+            for x, y in ((x0, y0), (x1, y0), (x0, y1), (x1, y1)):
+                quads.append(a * x + c * y + e)
+                quads.append(b * x + d * y + f)
+        xs, ys = quads[0::2], quads[1::2]
+        return (
+            f"/Subtype/Highlight/Rect[{_numbers((min(xs), min(ys), max(xs), max(ys)))}]"
+            f"/QuadPoints[{_numbers(quads)}]/C[{_numbers(color)}]"
+        )
+
+    @staticmethod
+    def _box_object(mark, page_rect, matrix):
+        width, height = mark["size"]
+        scale_x, scale_y = page_rect.width / width, page_rect.height / height
+        x0, y0, x1, y1 = mark["box"]
+        rect = fitz.Rect(x0 * scale_x, y0 * scale_y, x1 * scale_x, y1 * scale_y)
+        return (
+            f"/Subtype/Square/Rect[{_numbers(rect * matrix)}]"
+            f"/C[{_numbers(mark['color'])}]/BS<</W 1.5>>"
+        )
+
     @staticmethod
-    def highlight_text_diffs(pdf_path, diffs, output_path):
-        """在PDF文本中标注差异"""
-        doc = fitz.open(pdf_path)
-        for page_num, page in enumerate(doc):
-            if page_num >= len(diffs):
-                break
-            for diff in diffs[page_num]:
-                for rect in diff["rects"]:
-                    annot = page.add_highlight_annot(rect)
-                    annot.set_colors(stroke=diff["color"])
-        doc.save(output_path)
-        doc.close()
+    def _existing_annots(doc, page):
+        """页面上已有标注的引用（保留原文档中的批注与链接）"""
+        kind, value = doc.xref_get_key(page.xref, "Annots")
+        if kind == "xref":
+            value = doc.xref_object(int(value.split()[0]), compressed=True)
+        elif kind != "array":
+            return []
+        return re.findall(r"\d+ \d+ R", value)
 
     @staticmethod
-    def annotate_image_diffs(pdf_path, diff_mask, output_path):
-        """在PDF图像页面标注差异"""
-        doc = fitz.open(pdf_path)
-        page = doc[0]
-        img = cv2.imread(diff_mask)
-        img_bytes = cv2.imencode(".png", img)[1].tobytes()
-        rect = fitz.Rect(0, 0, page.rect.width, page.rect.height)
-        page.insert_image(rect, stream=img_bytes, overlay=True)
-        doc.save(output_path)
-        doc.close()
+    def highlight_text_diffs(pdf_path, diffs, output_path=None):
+        """在PDF文本中标注差异
+
+        pdf_path 可以是文件路径或PDF内容；未指定 output_path 时返回标注后的PDF内容
+        """
+        return PDFAnnotator.annotate(pdf_path, diffs, output_path)
+
+    @staticmethod
+    def annotate_image_diffs(pdf_path, page_regions, size, color, output_path=None):
+        """在PDF图像页面标注差异区域
+
+        page_regions 为页码到差异区域列表的映射，size 为比较时渲染图像的 (宽, 高)
+        """
+        return PDFAnnotator.annotate(
+            pdf_path,
+            {
+                page_num: image_region_marks(regions, size, color)
+                for page_num, regions in page_regions.items()
+            },
+            output_path,
+        )
@@ -0,0 +1,29 @@
+# preview.py
+"""页面预览渲染
+
+前端只展示有差异的页面：缩略图与整页均按需逐页渲染为 PNG（PyMuPDF，含标注层），
+不再将整份PDF嵌入页面。
+"""
+
+from typing import List, Sequence
+
+import fitz
+
+# 缩略图与整页预览的渲染分辨率
+THUMBNAIL_DPI = 30
+PAGE_DPI = 110
+
+
+def render_png(data: bytes, page_number: int, dpi: int = PAGE_DPI) -> bytes:
+    """将单页（页码从 0 开始）渲染为 PNG"""
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return doc[page_number].get_pixmap(dpi=dpi).tobytes("png")
+
+
+def changed_pairs(page_map: Sequence, include_unchanged: bool = False) -> List[tuple]:
+    """需要预览的页对：(原始页码, 对比页码, 状态)，默认只保留有差异的页对"""
+    return [
+        tuple(entry)
+        for entry in page_map
+        if include_unchanged or entry[2] != "unchanged"
+    ]
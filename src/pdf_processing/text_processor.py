@@ -1,110 +1,209 @@
-import pdfplumber
-import fitz
-from difflib import Differ, ndiff
+from difflib import Differ
+
+from .document_cache import load_document
+from ..utils.instrumentation import span
+from ..utils.progress import checkpoint
+from .fingerprint import new_page_stats, pages_identical
+from ..diff_detection.page_align import align_pages
+from ..diff_detection.text_diff import (
+    NDIFF_MAX_LINES,
+    changed_runs,
+    diff_lines,
+    get_opcodes,
+    select_engine,
+)
+
+ADDED_COLOR = (1, 1, 0)  # 黄色高亮
+REMOVED_COLOR = (1, 0, 0)  # 红色高亮
 
 
 class TextProcessor:
-    def __init__(self):
+    """文本提取与差异比较
+
+    参数：
+    diff_engine (str): 差异引擎 'auto'、'ndiff'、'myers' 或 'patience' (默认: auto)
+    ndiff_max_lines (int): auto 模式下仍使用 ndiff 的最大行数 (默认: 2000)
+    extractor (str): 文本提取后端 'pdfplumber' 或 'pymupdf' (默认: PDF_DIFF_EXTRACTOR)
+    """
+
+    def __init__(
+        self, diff_engine="auto", ndiff_max_lines=NDIFF_MAX_LINES, extractor=None
+    ):
         self.differ = Differ()
+        self.diff_engine = diff_engine
+        self.ndiff_max_lines = ndiff_max_lines
+        self.extractor = extractor
+
+    def _load(self, pdf_path):
+        return load_document(pdf_path, self.extractor)
 
     def extract_text(self, pdf_path):
-        full_text = []
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text(x_tolerance=1, y_tolerance=1)
-                    if text:
-                        full_text.append(text)
-            return "\n".join(full_text)
+            return self._load(pdf_path).text
         except Exception as e:
             print(f"Text extraction failed: {e}")
             return ""
 
+    def _select_engine(self, size):
+        if self.diff_engine == "auto":
+            # 大文档改用线性空间引擎，避免 ndiff 行内模糊匹配的平方级开销
+            return select_engine(size, self.ndiff_max_lines)
+        return self.diff_engine
+
     def compare_text(self, text1, text2):
-        diff = ndiff(text1.splitlines(), text2.splitlines())
-        return self._parse_diff(diff)
-
-    def _parse_diff(self, diff):
-        results = []
-        for line in diff:
-            code = line[0]
-            content = line[2:]
-            if code == " ":
-                continue
-            results.append(
-                {
-                    "type": "added" if code == "+" else "removed",
-                    "content": content,
-                    "position": None,  # 可添加位置信息
-                }
-            )
-        return results
+        lines1, lines2 = text1.splitlines(), text2.splitlines()
+        engine = self._select_engine(max(len(lines1), len(lines2)))
+        return diff_lines(lines1, lines2, engine=engine)
 
     def get_page_diffs(self, pdf_path1, pdf_path2):
         """获取每页的文本差异及其位置信息"""
-        diffs = []
-        with pdfplumber.open(pdf_path1) as pdf1, pdfplumber.open(pdf_path2) as pdf2:
-            for page1, page2 in zip(pdf1.pages, pdf2.pages):
-                text1 = page1.extract_text(x_tolerance=1, y_tolerance=1) or ""
-                text2 = page2.extract_text(x_tolerance=1, y_tolerance=1) or ""
-                diff = self.compare_text(text1, text2)
-                page_diffs = self._extract_diff_positions(diff, page2)
-                diffs.append(page_diffs)
+        doc1, doc2 = self._load(pdf_path1), self._load(pdf_path2)
+        plan = self._plan_pages(doc1, doc2, new_page_stats())
+        diffs = [[] for _ in range(doc2.page_count)]
+        for (_, page_num), (page1, page2) in zip(
+            plan, self._page_texts(doc1, doc2, plan)
+        ):
+            if page2 is None:
+                continue
+            diff = self.compare_text(page1.text if page1 else "", page2.text)
+            diffs[page_num] = self._extract_diff_positions(diff, page2)
         return diffs
 
     def _extract_diff_positions(self, diff, page):
         """提取差异位置信息"""
-        page_diffs = []
-        for line in diff:
-            if line["type"] == "added":
-                # 查找新增内容在页面中的位置
-                positions = self._find_text_positions(line["content"], page)
-                for pos in positions:
-                    page_diffs.append({"bbox": pos, "type": line["type"]})
-        return page_diffs
-
-    def _find_text_positions(self, text, page):
-        """在页面中查找文本的位置"""
-        positions = []
-        for char in page.chars:
-            if text in char["text"]:
-                positions.append((char["x0"], char["y0"], char["x1"], char["y1"]))
-        return positions
+        added = [line["content"] for line in diff if line["type"] == "added"]
+        # 查找新增内容在页面中的位置
+        return [
+            {"bbox": pos, "type": "added"}
+            for pos in self._find_text_positions(added, page)
+        ]
+
+    def _find_text_positions(self, lines, page):
+        """在页面中查找文本行的位置（左下角原点的 x0, y0, x1, y1 坐标）"""
+        return [
+            (rect.x0, page.height - rect.y1, rect.x1, page.height - rect.y0)
+            for rect in page.word_table.rects_for_lines(lines)
+        ]
+
+    def _plan_pages(self, doc1, doc2, page_stats, pairs=None):
+        """对齐两个文档的页面，返回需要比较的页对（指纹相同的页对被跳过）
+
+        参数：
+        pairs: 已对齐的页对，为 None 时对全部页面做对齐
+
+        返回：
+        list: (page1, page2) 页码对，插入页的 page1 与删除页的 page2 为 None
+        """
+        if pairs is None:
+            pairs = align_pages(doc1.fingerprints, doc2.fingerprints)
+        plan = []
+        for page1, page2 in pairs:
+            page_stats["total"] += 1
+            if page1 is None:
+                page_stats["inserted"] += 1
+            elif page2 is None:
+                page_stats["deleted"] += 1
+            elif pages_identical(doc1.fingerprints[page1], doc2.fingerprints[page2]):
+                page_stats["skipped"] += 1
+                continue
+            else:
+                page_stats["compared"] += 1
+            plan.append((page1, page2))
+        return plan
+
+    @staticmethod
+    def _page_texts(doc1, doc2, plan):
+        """批量解析计划中的页面，返回每个页对的 (page1, page2) 提取结果"""
+        pages1 = doc1.load_pages(p1 for p1, _ in plan if p1 is not None)
+        pages2 = doc2.load_pages(p2 for _, p2 in plan if p2 is not None)
+        pages1 = {page.page_number: page for page in pages1}
+        pages2 = {page.page_number: page for page in pages2}
+        return [(pages1.get(p1), pages2.get(p2)) for p1, p2 in plan]
+
+    def _compare_words(self, page1, page2, page_num1, page_num2):
+        """在两页的单词流上做单词级差异，直接产出两侧的高亮矩形
+
+        返回：
+        list: 差异条目，position 中记录页码、单词下标区间与合并后的矩形
+        """
+        table1 = page1.word_table if page1 is not None else None
+        table2 = page2.word_table if page2 is not None else None
+        tokens1 = table1.text if table1 is not None else []
+        tokens2 = table2.text if table2 is not None else []
+        engine = self._select_engine(max(len(tokens1), len(tokens2)))
+
+        entries = []
+        for kind, start, end in changed_runs(get_opcodes(tokens1, tokens2, engine)):
+            if kind == "removed":
+                table, tokens, page_num = table1, tokens1, page_num1
+            else:
+                table, tokens, page_num = table2, tokens2, page_num2
+            entries.append(
+                {
+                    "type": kind,
+                    "content": " ".join(tokens[start:end]),
+                    "position": {
+                        "page": page_num,
+                        "words": (start, end),
+                        "rects": table.run_rects(start, end),
+                    },
+                }
+            )
+        return entries
+
+    def compare_pages(self, pdf_path1, pdf_path2, pairs=None):
+        """逐页比较两个文档，指纹相同的页面直接跳过
+
+        参数：
+        pairs: 仅比较这些已对齐的页对（混合文档中分派给文本引擎的部分）
+
+        返回：
+        dict: details 为单词级差异详情，positions 为对比文件每页的新增高亮，
+              removed_positions 为原始文件每页的删除高亮，
+              page_stats 为页面比较/跳过统计
+        """
+        doc1, doc2 = self._load(pdf_path1), self._load(pdf_path2)
+        page_stats = new_page_stats()
+        plan = self._plan_pages(doc1, doc2, page_stats, pairs)
+
+        details = []
+        # 新增内容标注在对比文件上，删除内容标注在原始文件上，均按各自页码组织
+        positions = [[] for _ in range(doc2.page_count)]
+        removed_positions = [[] for _ in range(doc1.page_count)]
+        for index, ((page_num1, page_num2), (page1, page2)) in enumerate(
+            zip(plan, self._page_texts(doc1, doc2, plan))
+        ):
+            # 页面边界：上报进度，任务已取消时在此结束
+            checkpoint("text", index, len(plan))
+            with span("text.page", page1=page_num1, page2=page_num2) as page_span:
+                entries = self._compare_words(page1, page2, page_num1, page_num2)
+                page_span.set(
+                    words1=len(page1.words) if page1 is not None else 0,
+                    words2=len(page2.words) if page2 is not None else 0,
+                    changes=len(entries),
+                )
+            for entry in entries:
+                details.append(entry)
+                position = entry["position"]
+                if entry["type"] == "added":
+                    positions[page_num2].append(
+                        {"rects": position["rects"], "color": ADDED_COLOR}
+                    )
+                else:
+                    removed_positions[page_num1].append(
+                        {"rects": position["rects"], "color": REMOVED_COLOR}
+                    )
+        checkpoint("text", len(plan), len(plan))
+        return {
+            "details": details,
+            "positions": positions,
+            "removed_positions": removed_positions,
+            "page_stats": page_stats,
+        }
 
     def get_text_positions(self, pdf_path1, pdf_path2):
         """获取精确的文本差异位置信息"""
-        diffs = []
-        with pdfplumber.open(pdf_path1) as pdf1, pdfplumber.open(pdf_path2) as pdf2:
-            for page_num, (page1, page2) in enumerate(zip(pdf1.pages, pdf2.pages)):
-                text1 = page1.extract_text() or ""
-                text2 = page2.extract_text() or ""
-                diff = self.compare_text(text1, text2)
-
-                page_diffs = []
-                for d in diff:
-                    # 仅处理新增内容
-                    if d["type"] == "added":
-                        # 使用精确单词匹配
-                        words = page2.extract_words(
-                            keep_blank_chars=True, x_tolerance=1
-                        )
-                        target_word = d["content"].strip()
-
-                        # 查找完全匹配的单词
-                        matched_words = [
-                            w for w in words if w["text"].strip() == target_word
-                        ]
-
-                        for word in matched_words:
-                            # 坐标转换：pdfplumber坐标系 -> PyMuPDF坐标系
-                            rect = fitz.Rect(
-                                word["x0"], word["top"], word["x1"], word["bottom"]
-                            )
-                            page_diffs.append(
-                                {"rects": [rect], "color": (1, 1, 0)}  # 黄色高亮
-                            )
-                diffs.append(page_diffs)
-        return diffs
+        return self.compare_pages(pdf_path1, pdf_path2)["positions"]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+# word_index.py
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+import fitz
+
+from .fingerprint import normalize_text
+
+# 单词顶部坐标相差不超过该值时视为同一行
+LINE_TOLERANCE = 3.0
+
+
+class WordTable:
+    """单页单词的紧凑索引
+
+    - 坐标按列存放在 array 中（x0 / top / x1 / bottom，左上角原点）
+    - by_text: 单词文本到下标列表的哈希索引
+    - lines: 每一行对应的单词下标区间 [start, end)，line_of: 每个单词所在的行号
+    - by_line: 规范化行文本到行号列表的哈希索引
+
+    差异行到矩形的映射只需查表，不再对每条差异重复提取或线性扫描单词。
+    """
+
+    def __init__(self, words: List[dict]):
+        self.text = [w["text"] for w in words]
+        self.x0 = array("d", (w["x0"] for w in words))
+        self.top = array("d", (w["top"] for w in words))
+        self.x1 = array("d", (w["x1"] for w in words))
+        self.bottom = array("d", (w["bottom"] for w in words))
+
+        self.by_text: Dict[str, List[int]] = {}
+        for i, text in enumerate(self.text):
+            self.by_text.setdefault(normalize_text(text), []).append(i)
+
+        self.lines: List[Tuple[int, int]] = []
+        start = 0
+        for i in range(1, len(self.text) + 1):
+            if (
+                i == len(self.text)
+                or abs(self.top[i] - self.top[start]) > LINE_TOLERANCE
+            ):
+                self.lines.append((start, i))
+                start = i
+
+        self.line_of = array("i", [0] * len(self.text))
+        for line_no, (start, end) in enumerate(self.lines):
+            for i in range(start, end):
+                self.line_of[i] = line_no
+
+        self.by_line: Dict[str, List[int]] = {}
+        for line_no, (start, end) in enumerate(self.lines):
+            line_text = normalize_text(" ".join(self.text[start:end]))
+            self.by_line.setdefault(line_text, []).append(line_no)
+
+    def __len__(self):
+        return len(self.text)
+
+    def word_rect(self, i: int) -> fitz.Rect:
+        return fitz.Rect(self.x0[i], self.top[i], self.x1[i], self.bottom[i])
+
+    def span_rect(self, start: int, end: int) -> fitz.Rect:
+        """单词下标区间 [start, end) 的外接矩形"""
+        return fitz.Rect(
+            min(self.x0[start:end]),
+            min(self.top[start:end]),
+            max(self.x1[start:end]),
+            max(self.bottom[start:end]),
+        )
+
+    def line_rect(self, line_no: int) -> fitz.Rect:
+        return self.span_rect(*self.lines[line_no])
+
+    def run_rects(self, start: int, end: int) -> List[fitz.Rect]:
+        """单词下标区间 [start, end) 的合并矩形，跨行时每行一个矩形"""
+        rects = []
+        run_start = start
+        for i in range(start + 1, end + 1):
+            if i == end or self.line_of[i] != self.line_of[run_start]:
+                rects.append(self.span_rect(run_start, i))
+                run_start = i
+        return rects
+
+    def rects_for_lines(self, contents: Iterable[str]) -> List[fitz.Rect]:
+        """将差异行映射为矩形（一次遍历，每条差异行只查表）
+
+        相同文本的差异行按出现顺序依次对应页面中的各次出现；
+        找不到对应行时回退为按单词精确匹配。
+        """
+        used: Dict[str, int] = {}
+        rects = []
+        for content in contents:
+            key = normalize_text(content)
+            candidates = self.by_line.get(key, ())
+            nth = used.get(key, 0)
+            if nth < len(candidates):
+                used[key] = nth + 1
+                rects.append(self.line_rect(candidates[nth]))
+            else:
+                rects.extend(self.word_rect(i) for i in self.by_text.get(key, ()))
+        return rects
@@ -1,98 +1,324 @@
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import cv2
 import numpy as np
 import os
+import tempfile
 
 from ..pdf_processing.image_processor import ImageProcessor
-from ..pdf_processing.text_processor import TextProcessor
+from ..pdf_processing.text_processor import ADDED_COLOR, REMOVED_COLOR, TextProcessor
 from ..pdf_processing.classifier import PDFClassifier
-from ..diff_detection.image_diff import ImageComparator
-from ..pdf_processing.pdf_annotation import PDFAnnotator
+from ..pdf_processing.document_cache import load_document, read_source
+from ..pdf_processing.extraction import get_extractor
+from ..pdf_processing.fingerprint import new_page_stats
+from ..diff_detection.image_pipeline import ImageDiffPipeline
+from ..diff_detection.page_align import align_pages, route_pairs
+from ..pdf_processing.pdf_annotation import PDFAnnotator, image_region_marks
+from .executors import get_pool, run_blocking
+from .instrumentation import request_trace
+from .progress import checkpoint
+from .model_registry import registry
+from .result_cache import ResultCache, get_result_cache
 
-executor = ThreadPoolExecutor(max_workers=2)
 
+def preload_models():
+    """启动预热钩子：提前加载分类器与图像比较模型，避免首个请求承担加载耗时"""
+    registry.preload()
 
-async def async_compare(file1, file2):
-    loop = asyncio.get_event_loop()
 
-    # 获取项目根目录路径
-    project_root = os.path.dirname(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 以下为提交到执行器层的任务，定义为模块级函数以便在进程池中执行。
+# source 为文件路径或PDF内容（bytes），内容在进程内通过提取缓存共享。
+
+
+def classify_pdf(source):
+    return PDFClassifier().classify(source)
+
+
+def classify_pdf_pages(source):
+    return PDFClassifier().classify_pages(source)
+
+
+def align_pdf_pages(source1, source2):
+    doc1, doc2 = load_document(source1), load_document(source2)
+    return align_pages(doc1.fingerprints, doc2.fingerprints)
+
+
+def compare_text_pdfs(source1, source2, pairs=None):
+    return TextProcessor().compare_pages(source1, source2, pairs)
+
+
+def render_pdf_page(source, page_number):
+    return np.array(ImageProcessor().render_page(source, page_number))
+
+
+def compare_image_pdfs(pdf_path1, pdf_path2, pairs=None):
+    # 在 io 池中编排，逐页比较任务分派到 cpu 池
+    pool = get_pool()
+    pipeline = ImageDiffPipeline(
+        max_workers=pool.cpu_workers, executor=pool.executor("cpu")
     )
-    temp_dir = os.path.join(project_root, "data\\temp")
+    return pipeline.compare(pdf_path1, pdf_path2, pairs)
+
+
+def document_digest(source):
+    return load_document(source).digest
+
 
-    # 检查并创建 temp 目录
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
+def spill_to_disk(source, directory, name):
+    """poppler 只能按路径渲染：内存中的PDF写入本次任务的临时目录，路径直接返回"""
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    document = load_document(source)
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(document.data)
+    return path
 
-    # 构建文件的绝对路径
-    file1_path = os.path.join(temp_dir, file1.name)
-    file2_path = os.path.join(temp_dir, file2.name)
 
+def make_cache_entry(result):
+    """生成缓存条目（标注PDF已是文件内容，直接保存）"""
+    return {k: v for k, v in result.items() if k != "trace"}
+
+
+async def async_compare(file1, file2):
+    """比较两个上传文件（文件对象、bytes、memoryview 或路径）
+
+    上传内容直接在内存中处理，不写入共享目录，并发请求互不影响。
+    """
     try:
-        # 保存上传文件
-        with open(file1_path, "wb") as f:
-            f.write(file1.getbuffer())
-        with open(file2_path, "wb") as f:
-            f.write(file2.getbuffer())
+        source1, source2 = read_source(file1), read_source(file2)
     except Exception as e:
-        print(f"文件保存失败: {e}")
-        return {"type": "error", "message": f"文件保存失败: {e}"}
+        print(f"读取上传文件失败: {e}")
+        return {"type": "error", "message": f"读取上传文件失败: {e}"}
+
+    return await compare_cached(source1, source2)
+
+
+def _source_name(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(source)
+    return f"<{len(source)} bytes>"
+
 
-    # 分类处理
+async def compare_cached(source1, source2, trace=None, profile=None):
+    """比较两个PDF，相同文件对直接返回结果缓存中的上次结果
+
+    参数：
+    source1, source2: PDF文件路径或内容（bytes）
+    trace (bool): 是否记录分阶段 trace 并放入结果的 "trace" 字段，默认读取 PDF_DIFF_TRACE
+    profile (str): 本次请求的 cProfile 输出路径，默认读取 PDF_DIFF_PROFILE
+    """
+    with request_trace(
+        "compare",
+        enabled=trace,
+        profile=profile,
+        original=_source_name(source1),
+        modified=_source_name(source2),
+    ) as request:
+        result = await _compare_cached(source1, source2)
+    if request is not None:
+        result["trace"] = request.to_dict()
+    return result
+
+
+def comparison_settings():
+    """影响比较结果的设置，计入结果缓存键，切换任一设置都不会命中旧结果"""
     classifier = PDFClassifier()
-    file_type = classifier.classify(file1_path)
-
-    # 统一定义：output_path
-    output_path = os.path.join(temp_dir, "annotated.pdf")
-
-    if file_type == "text":
-        processor = TextProcessor()
-        # 获取精确的差异位置
-        diffs = processor.get_text_positions(file1_path, file2_path)
-
-        # # 生成标注PDF
-        # output_path = os.path.join(temp_dir, "annotated.pdf")
-
-        # 获取文本差异详情
-        test1 = await loop.run_in_executor(executor, processor.extract_text, file1_path)
-        test2 = await loop.run_in_executor(executor, processor.extract_text, file2_path)
-        details = processor.compare_text(test1, test2)
-
-        try:
-            PDFAnnotator.highlight_text_diffs(file2_path, diffs, output_path)
-        except Exception as e:
-            print(f"PDF标注失败: {str(e)}")
-            return {"type": "error", "message": "文本差异标注失败"}
-
-        return {
-            "type": "text",
-            "annotated_pdf": output_path,
-            "original_pdf": file1_path,
-            "details": details,  # 添加文本差异详情
-        }
-    else:
-        processor = ImageProcessor()
-        images1 = await loop.run_in_executor(
-            executor, processor.pdf_to_images, file1_path
+    pipeline = ImageDiffPipeline()
+    return {
+        "extractor": get_extractor().name,
+        "dpi": pipeline.dpi,
+        "changed_ratio": pipeline.changed_ratio,
+        # 分类模型与优化方式决定页面分派到文本还是图像引擎
+        "classifier": PDFClassifier.model_key(
+            classifier.model_path, classifier.device, classifier.optimize
+        ),
+    }
+
+
+async def _compare_cached(source1, source2):
+    cache = get_result_cache()
+    if cache is None:
+        return await compare_files(source1, source2)
+    # 摘要由提取缓存计算，后续阶段复用同一份文档
+    digest1, digest2 = await asyncio.gather(
+        run_blocking("io", document_digest, source1),
+        run_blocking("io", document_digest, source2),
+    )
+    cache_key = ResultCache.make_key(digest1, digest2, comparison_settings())
+    entry = await run_blocking("io", cache.get, cache_key)
+    if entry is not None:
+        return dict(entry)
+
+    result = await compare_files(source1, source2)
+    if result["type"] != "error":
+        await run_blocking("io", cache.put, cache_key, make_cache_entry(result))
+    return result
+
+
+async def compare_files(source1, source2):
+    """比较两个PDF（文件路径或内容）
+
+    两个文件逐页分类并对齐页面后，纯文本页对交给文本引擎，
+    含扫描页的页对交给图像引擎；结果类型为 text、image 或 mixed。
+    两个引擎的差异汇总后每个文件只标注一次，标注后的PDF以内容（bytes）
+    放在结果的 annotated_pdf / annotated_original_pdf 中。
+    """
+    # 分类与对齐（所有阻塞调用均在执行器中运行，不阻塞事件循环）
+    checkpoint("classify")
+    types1, types2, pairs = await asyncio.gather(
+        run_blocking("cpu", classify_pdf_pages, source1),
+        run_blocking("cpu", classify_pdf_pages, source2),
+        run_blocking("cpu", align_pdf_pages, source1, source2),
+    )
+    routes = route_pairs(pairs, types1, types2)
+
+    result = {
+        "page_types": {"original": types1, "modified": types2},  # 逐页类型
+        "page_stats": new_page_stats(),  # 页面比较/跳过统计
+    }
+    # 原始文件标注删除内容，对比文件标注新增内容，按各自页码组织
+    marks = {"original": {}, "modified": {}}
+    if routes["text"] or not routes["image"]:
+        text_result = await _compare_text_pages(source1, source2, routes["text"])
+        _add_text_marks(
+            marks, text_result.pop("removed_positions"), text_result.pop("positions")
         )
-        images2 = await loop.run_in_executor(
-            executor, processor.pdf_to_images, file2_path
+        _merge_result(result, text_result)
+    if routes["image"]:
+        image_result = await _compare_image_pages(source1, source2, routes["image"])
+        _add_image_marks(marks, image_result["pages"])
+        _merge_result(result, image_result)
+
+    checkpoint("annotate")
+    try:
+        annotated_original, annotated = await asyncio.gather(
+            run_blocking("io", PDFAnnotator.annotate, source1, marks["original"]),
+            run_blocking("io", PDFAnnotator.annotate, source2, marks["modified"]),
         )
-        comparator = ImageComparator()
-        diff_img = await loop.run_in_executor(
-            executor,
-            comparator.structural_compare,
-            np.array(images1[0]),
-            np.array(images2[0]),
+    except Exception as e:
+        print(f"PDF标注失败: {str(e)}")
+        return {"type": "error", "message": "差异标注失败"}
+    result["annotated_pdf"] = annotated  # 标注后的对比文件内容
+    result["annotated_original_pdf"] = annotated_original  # 标注后的原始文件内容
+
+    if routes["text"] and routes["image"]:
+        result["type"] = "mixed"
+    else:
+        result["type"] = "image" if routes["image"] else "text"
+    result["page_map"] = build_page_map(
+        pairs, result.get("details", ()), result.get("pages", ())
+    )
+    return result
+
+
+def build_page_map(pairs, details=(), image_pages=()):
+    """逐页对照表
+
+    返回：
+    list: 按对齐顺序的 (原始页码, 对比页码, 状态)，页码从 0 开始，
+          状态为 changed、unchanged、inserted 或 deleted
+    """
+    removed = {d["position"]["page"] for d in details if d["type"] == "removed"}
+    added = {d["position"]["page"] for d in details if d["type"] == "added"}
+    image_status = {(p["page1"], p["page2"]): p["status"] for p in image_pages}
+    page_map = []
+    for page1, page2 in pairs:
+        if page1 is None:
+            status = "inserted"
+        elif page2 is None:
+            status = "deleted"
+        elif (page1, page2) in image_status:
+            changed = image_status[(page1, page2)] == "changed"
+            status = "changed" if changed else "unchanged"
+        else:
+            changed = page1 in removed or page2 in added
+            status = "changed" if changed else "unchanged"
+        page_map.append((page1, page2, status))
+    return page_map
+
+
+def _merge_result(result, part):
+    """合并文本/图像部分的结果，页面统计累加"""
+    page_stats = result["page_stats"]
+    for key, value in part.pop("page_stats").items():
+        page_stats[key] += value
+    result.update(part)
+
+
+def _add_text_marks(marks, removed_positions, positions):
+    for side, side_positions in (
+        ("original", removed_positions),
+        ("modified", positions),
+    ):
+        for page_num, page_marks in enumerate(side_positions):
+            if page_marks:
+                marks[side].setdefault(page_num, []).extend(page_marks)
+
+
+def _add_image_marks(marks, pages):
+    # 同一组差异区域在原始页与对比页上分别标注
+    for page in pages:
+        if not page["regions"]:
+            continue
+        for side, page_num, color in (
+            ("original", page["page1"], REMOVED_COLOR),
+            ("modified", page["page2"], ADDED_COLOR),
+        ):
+            marks[side].setdefault(page_num, []).extend(
+                image_region_marks(page["regions"], page["size"], color)
+            )
+
+
+async def _compare_text_pages(source1, source2, pairs):
+    # 逐页比较：指纹相同的页面跳过差异比较与定位
+    comparison = await run_blocking("cpu", compare_text_pdfs, source1, source2, pairs)
+    return {
+        "type": "text",
+        "details": comparison["details"],  # 添加文本差异详情
+        "positions": comparison["positions"],
+        "removed_positions": comparison["removed_positions"],
+        "page_stats": comparison["page_stats"],
+    }
+
+
+async def _compare_image_pages(source1, source2, pairs):
+    # 每个任务使用独立的临时目录存放需要落盘的文件，结束后删除
+    with tempfile.TemporaryDirectory(prefix="pdf_diff_") as job_dir:
+        path1, path2 = await asyncio.gather(
+            run_blocking("io", spill_to_disk, source1, job_dir, "original.pdf"),
+            run_blocking("io", spill_to_disk, source2, job_dir, "modified.pdf"),
         )
+        checkpoint("image")
+        return await _compare_image_paths(path1, path2, pairs)
+
+
+async def _compare_image_paths(file1_path, file2_path, pairs):
+    # 多页图像比较：逐页对齐后并行渲染与 SSIM 比较
+    comparison = await run_blocking(
+        "io", compare_image_pdfs, file1_path, file2_path, pairs
+    )
+
+    # 预览第一处有差异的匹配页（无差异时预览第一个匹配页）
+    matched = [p for p in comparison["pages"] if p["page1"] is not None]
+    preview = next((p for p in matched if p["status"] == "changed"), None)
+    if preview is not None:
+        page1, page2 = preview["page1"], preview["page2"]
+    else:
+        page1, page2 = (matched[0]["page1"], matched[0]["page2"]) if matched else (0, 0)
+    original = await run_blocking("io", render_pdf_page, file1_path, page1 + 1)
+    if preview is None:
+        modified = original
+        regions = []
+    else:
+        modified = await run_blocking("io", render_pdf_page, file2_path, page2 + 1)
+        regions = preview["regions"]
 
-        # 新增原始图像和差异图像数据
-        return {
-            "type": "image",
-            "original": np.array(images1[0]),  # 原始图像数据
-            "modified": np.array(images2[0]),  # 对比文件图像
-            "diff": diff_img,  # 差异掩膜
-            "annotated_pdf": output_path,  # 标注后的PDF路径
-        }
+    # 新增原始图像和差异图像数据
+    return {
+        "type": "image",
+        "original": original,  # 原始图像数据
+        "modified": modified,  # 对比文件图像
+        "regions": regions,  # 预览页的差异区域：box (x0, y0, x1, y1)、score、pixels
+        "pages": comparison["pages"],  # 逐页比较结果
+        "summary": comparison["summary"],  # 有差异页面汇总
+        "page_stats": comparison["page_stats"],
+    }
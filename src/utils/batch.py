@@ -0,0 +1,362 @@
+# batch.py
+"""无界面的批量比较入口
+
+按文件名匹配两个目录中的PDF，或读取 CSV/JSONL 清单中的文件对，
+以有界并发逐对比较。每个文件对写出一个 JSON 结果文件，全部完成后写出汇总报告；
+中断后重新运行会跳过已成功完成的文件对。
+
+用法：
+    python -m src.utils.batch DIR1 DIR2 -o OUTPUT_DIR
+    python -m src.utils.batch --manifest pairs.csv -o OUTPUT_DIR
+    python -m src.utils.batch --baseline signed.pdf DRAFTS_DIR -o OUTPUT_DIR
+"""
+
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import List, NamedTuple, Optional
+
+import fitz
+import numpy as np
+
+from .executors import run_blocking
+from .jobs import get_job_manager
+
+logger = logging.getLogger(__name__)
+
+# 同时在比较中的文件对数量
+DEFAULT_CONCURRENCY = 4
+RESULTS_DIR = "results"
+ANNOTATED_DIR = "annotated"
+REPORT_FILE = "report.json"
+
+
+class ComparePair(NamedTuple):
+    pair_id: str
+    original: str
+    modified: str
+
+
+def _safe_id(pair_id: str) -> str:
+    """将文件对标识转换为可用作文件名的字符串"""
+    return re.sub(r"[^\w.-]+", "_", pair_id).strip("_") or "pair"
+
+
+def _scan_pdfs(root: str) -> dict:
+    """目录中所有PDF文件：相对路径 -> 路径"""
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith(".pdf"):
+                path = os.path.join(dirpath, filename)
+                files[os.path.relpath(path, root)] = path
+    return files
+
+
+def pairs_from_dirs(dir1: str, dir2: str) -> List[ComparePair]:
+    """按相对路径匹配两个目录中的PDF文件（只在一侧存在的文件记录警告后跳过）"""
+    files1, files2 = _scan_pdfs(dir1), _scan_pdfs(dir2)
+    unmatched = sorted(files1.keys() ^ files2.keys())
+    if unmatched:
+        logger.warning(f"{len(unmatched)} 个文件只在一侧存在: {unmatched[:10]}")
+    return [
+        ComparePair(os.path.splitext(name)[0], files1[name], files2[name])
+        for name in sorted(files1.keys() & files2.keys())
+    ]
+
+
+def pairs_from_baseline(baseline: str, directory: str) -> List[ComparePair]:
+    """同一个基线文件与目录中的每个PDF组成文件对（一对多比较）"""
+    baseline_path = os.path.abspath(baseline)
+    return [
+        ComparePair(os.path.splitext(name)[0], baseline, path)
+        for name, path in sorted(_scan_pdfs(directory).items())
+        if os.path.abspath(path) != baseline_path
+    ]
+
+
+def pairs_from_manifest(manifest_path: str) -> List[ComparePair]:
+    """读取 CSV 或 JSONL 清单
+
+    每行包含 original 与 modified 两列（文件路径，相对路径以清单所在目录为基准），
+    可选 id 列作为结果文件名；缺省时使用行号与对比文件名。
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding="utf-8", newline="") as f:
+        if manifest_path.lower().endswith((".jsonl", ".json")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    pairs = []
+    for index, row in enumerate(rows):
+        try:
+            original, modified = row["original"], row["modified"]
+        except KeyError as e:
+            raise ValueError(f"清单第 {index + 1} 行缺少列: {e}") from None
+        stem = os.path.splitext(os.path.basename(modified))[0]
+        pairs.append(
+            ComparePair(
+                str(row.get("id") or f"{index:06d}_{stem}"),
+                os.path.join(base_dir, original),
+                os.path.join(base_dir, modified),
+            )
+        )
+    return pairs
+
+
+def to_jsonable(value):
+    """将比较结果转换为可序列化的结构（图像数组、掩膜与文件内容不写入结果文件）"""
+    if isinstance(value, dict):
+        return {
+            str(k): to_jsonable(v)
+            for k, v in value.items()
+            if not isinstance(v, (np.ndarray, bytes))
+        }
+    if isinstance(value, (list, tuple, fitz.Rect)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (np.ndarray, bytes)):
+        return None
+    return value
+
+
+def has_differences(result: dict) -> bool:
+    """比较结果中是否存在差异"""
+    stats = result.get("page_stats", {})
+    return bool(
+        result.get("details")
+        or result.get("summary", {}).get("changed")
+        or stats.get("inserted")
+        or stats.get("deleted")
+    )
+
+
+def _write_json(path: str, data) -> None:
+    # 先写入临时文件再原子替换，中断时不会留下不完整的结果
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _load_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class BatchRunner:
+    """批量比较多个文件对
+
+    参数：
+    output_dir (str): 结果目录，包含 results/（逐对结果）、annotated/（标注PDF）
+                      与 report.json（汇总报告）
+    concurrency (int): 同时提交的文件对数量 (默认: 4)，实际并行度另受任务队列的全局上限约束；
+                       命令行按该值配置任务队列（见 main）
+    resume (bool): 跳过已有成功结果的文件对 (默认: True)
+    timeout (float): 单个文件对的超时秒数 (默认: PDF_DIFF_JOB_TIMEOUT)
+
+    比较以批量优先级提交到任务队列，不会占满交互任务的名额。
+    """
+
+    def __init__(
+        self, output_dir, concurrency=DEFAULT_CONCURRENCY, resume=True, timeout=None
+    ):
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.resume = resume
+        self.timeout = timeout
+        self.results_dir = os.path.join(output_dir, RESULTS_DIR)
+        self.annotated_dir = os.path.join(output_dir, ANNOTATED_DIR)
+
+    def result_path(self, pair: ComparePair) -> str:
+        return os.path.join(self.results_dir, f"{_safe_id(pair.pair_id)}.json")
+
+    def is_done(self, pair: ComparePair) -> bool:
+        record = _load_json(self.result_path(pair))
+        return record is not None and record.get("status") == "ok"
+
+    async def compare_pair(self, pair: ComparePair) -> dict:
+        """比较单个文件对并写出结果文件"""
+        start = time.perf_counter()
+        manager = get_job_manager()
+        try:
+            job = manager.submit(
+                pair.original, pair.modified, priority="batch", timeout=self.timeout
+            )
+            await manager.wait_async(job)
+            if job.status == "done":
+                result, status = job.result, "ok"
+                await run_blocking("io", self.write_annotated, pair, result)
+            else:
+                result = {"type": "error", "message": job.error or job.status}
+                status = "error"
+            manager.discard(job.job_id)
+        except Exception as e:
+            logger.exception(f"比较失败: {pair.pair_id}")
+            result = {"type": "error", "message": str(e)}
+            status = "error"
+        record = {
+            "id": pair.pair_id,
+            "original": pair.original,
+            "modified": pair.modified,
+            "status": status,
+            "changed": status == "ok" and has_differences(result),
+            "elapsed": round(time.perf_counter() - start, 3),
+            "result": to_jsonable(result),
+        }
+        await run_blocking("io", _write_json, self.result_path(pair), record)
+        return record
+
+    def write_annotated(self, pair: ComparePair, result: dict) -> None:
+        """将结果中的标注PDF内容写入 annotated/，结果中改为记录文件路径"""
+        stem = os.path.join(self.annotated_dir, _safe_id(pair.pair_id))
+        for key, suffix in (
+            ("annotated_pdf", ".pdf"),
+            ("annotated_original_pdf", "_original.pdf"),
+        ):
+            if result.get(key) is not None:
+                path = stem + suffix
+                with open(path, "wb") as f:
+                    f.write(result[key])
+                result[key] = path
+
+    async def run(self, pairs: List[ComparePair]) -> dict:
+        """比较所有文件对，返回汇总报告"""
+        os.makedirs(self.results_dir, exist_ok=True)
+        os.makedirs(self.annotated_dir, exist_ok=True)
+        ids = [_safe_id(pair.pair_id) for pair in pairs]
+        if len(set(ids)) != len(ids):
+            raise ValueError("文件对标识重复，无法区分结果文件")
+
+        todo = [p for p in pairs if not (self.resume and self.is_done(p))]
+        if len(todo) < len(pairs):
+            logger.info(f"跳过已完成的文件对: {len(pairs) - len(todo)}")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+
+        async def bounded(pair):
+            async with semaphore:
+                record = await self.compare_pair(pair)
+                logger.info(
+                    f"[{record['status']}] {pair.pair_id} ({record['elapsed']}s)"
+                )
+
+        await asyncio.gather(*(bounded(pair) for pair in todo))
+        report = self.build_report(pairs)
+        report["compared"] = len(todo)
+        report["elapsed"] = round(time.perf_counter() - start, 3)
+        _write_json(os.path.join(self.output_dir, REPORT_FILE), report)
+        return report
+
+    def build_report(self, pairs: List[ComparePair]) -> dict:
+        """从各结果文件汇总报告（包含之前运行中完成的文件对）"""
+        report = {
+            "total": len(pairs),
+            "ok": 0,
+            "error": 0,
+            "missing": 0,
+            "changed": [],
+            "errors": [],
+            "types": {},
+            "page_stats": {},
+        }
+        for pair in pairs:
+            record = _load_json(self.result_path(pair))
+            if record is None:
+                report["missing"] += 1
+                continue
+            report[record["status"]] += 1
+            result = record["result"]
+            if record["status"] == "error":
+                report["errors"].append(
+                    {"id": pair.pair_id, "message": result.get("message")}
+                )
+                continue
+            if record["changed"]:
+                report["changed"].append(pair.pair_id)
+            kind = result.get("type")
+            report["types"][kind] = report["types"].get(kind, 0) + 1
+            for key, count in result.get("page_stats", {}).items():
+                report["page_stats"][key] = report["page_stats"].get(key, 0) + count
+        return report
+
+
+def run_batch(
+    pairs, output_dir, concurrency=DEFAULT_CONCURRENCY, resume=True, timeout=None
+):
+    """同步入口：批量比较文件对并返回汇总报告"""
+    return asyncio.run(BatchRunner(output_dir, concurrency, resume, timeout).run(pairs))
+
+
+def main(argv=None):
+    import argparse
+
+    from .executors import configure_executors
+    from .jobs import configure_job_manager
+
+    parser = argparse.ArgumentParser(description="批量比较PDF文件对")
+    parser.add_argument("dirs", nargs="*", help="原始文件目录与对比文件目录")
+    parser.add_argument(
+        "--manifest", help="CSV 或 JSONL 清单（original, modified[, id]）"
+    )
+    parser.add_argument(
+        "--baseline", help="一对多比较：该基线文件与目录中的每个PDF比较"
+    )
+    parser.add_argument("-o", "--output", required=True, help="结果目录")
+    parser.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--no-resume", action="store_true", help="重新比较所有文件对")
+    parser.add_argument("--timeout", type=float, help="单个文件对的超时秒数")
+    parser.add_argument("--executor", choices=("thread", "process", "inline"))
+    args = parser.parse_args(argv)
+
+    if args.baseline:
+        if len(args.dirs) != 1:
+            parser.error("--baseline 需要提供一个候选文件目录")
+        pairs = pairs_from_baseline(args.baseline, args.dirs[0])
+    elif args.manifest:
+        pairs = pairs_from_manifest(args.manifest)
+    elif len(args.dirs) == 2:
+        pairs = pairs_from_dirs(*args.dirs)
+    else:
+        parser.error("需要提供两个目录、--manifest 或 --baseline")
+    if args.executor:
+        configure_executors(args.executor)
+    # 命令行进程中没有交互任务：并发上限取 -j，不为交互任务保留名额
+    configure_job_manager(max_jobs=args.concurrency, interactive_slots=0)
+
+    if args.baseline:
+        from .fanout import run_fanout_batch
+
+        runner = BatchRunner(
+            args.output, args.concurrency, not args.no_resume, args.timeout
+        )
+        report = asyncio.run(run_fanout_batch(args.baseline, pairs, runner))
+    else:
+        report = run_batch(
+            pairs, args.output, args.concurrency, not args.no_resume, args.timeout
+        )
+    print(
+        f"共 {report['total']} 对: 成功 {report['ok']}, 失败 {report['error']}, "
+        f"有差异 {len(report['changed'])}"
+    )
+    return 1 if report["error"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+# executors.py
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import copy_context
+
+from .instrumentation import span, traced_call
+from .progress import track
+
+logger = logging.getLogger(__name__)
+
+MODES = ("thread", "process", "inline")
+# 任务类型：cpu 为解析/差异/SSIM 等计算密集任务，io 为渲染、保存与编排等等待型任务
+KINDS = ("cpu", "io")
+
+
+class InlineExecutor(Executor):
+    """在调用线程中同步执行任务的执行器（用于调试与单步分析）"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class ExecutorPool:
+    """可配置的执行器层，按任务类型分派到不同的池
+
+    参数：
+    mode (str): 'thread'、'process' 或 'inline' (默认: thread)
+    cpu_workers (int): 计算任务池大小 (默认: CPU 核数)
+    io_workers (int): 等待型任务池大小 (默认: CPU 核数 + 4，最多 32)
+
+    process 模式下计算任务进入进程池以绕开 GIL，等待型任务仍使用线程池；
+    提交到进程池的任务必须是可序列化的模块级函数。
+    """
+
+    def __init__(self, mode="thread", cpu_workers=None, io_workers=None):
+        if mode not in MODES:
+            raise ValueError(f"不支持的执行模式: {mode}")
+        cpu_count = os.cpu_count() or 1
+        self.mode = mode
+        self.cpu_workers = cpu_workers or cpu_count
+        self.io_workers = io_workers or min(32, cpu_count + 4)
+        self._executors = {}
+        self._lock = threading.Lock()
+
+    def executor(self, kind: str) -> Executor:
+        """获取指定任务类型的执行器（首次使用时创建）"""
+        if kind not in KINDS:
+            raise ValueError(f"不支持的任务类型: {kind}")
+        with self._lock:
+            executor = self._executors.get(kind)
+            if executor is None:
+                executor = self._create(kind)
+                self._executors[kind] = executor
+        return executor
+
+    def _create(self, kind: str) -> Executor:
+        if self.mode == "inline":
+            return InlineExecutor()
+        if kind == "cpu" and self.mode == "process":
+            logger.info(f"创建进程池: {self.cpu_workers} 个进程")
+            return ProcessPoolExecutor(max_workers=self.cpu_workers)
+        workers = self.cpu_workers if kind == "cpu" else self.io_workers
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=kind)
+
+    async def run(self, kind: str, fn, *args, **kwargs):
+        """在指定类型的执行器中运行阻塞函数，不阻塞事件循环
+
+        每次调用记录为一个以函数名命名的 span（未开启 trace 时无开销）。
+        提交的工作登记到当前任务，任务取消后仍可等待其返回。
+        """
+        executor = self.executor(kind)
+        name = getattr(fn, "__qualname__", getattr(fn, "__name__", repr(fn)))
+        if isinstance(executor, ProcessPoolExecutor):
+            # 子进程无法回传 span，只在调用方记录墙钟时间
+            with span(name, kind=kind, process=True):
+                future = track(executor.submit(fn, *args, **kwargs))
+                return await asyncio.wrap_future(future)
+        future = track(
+            executor.submit(copy_context().run, traced_call, name, fn, *args, **kwargs)
+        )
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=wait)
+
+
+_pool = ExecutorPool(
+    mode=os.environ.get("PDF_DIFF_EXECUTOR", "thread"),
+    cpu_workers=int(os.environ.get("PDF_DIFF_CPU_WORKERS", 0)) or None,
+    io_workers=int(os.environ.get("PDF_DIFF_IO_WORKERS", 0)) or None,
+)
+
+
+def submit(executor: Executor, fn, *args, **kwargs) -> Future:
+    """向执行器提交任务；线程池中的任务继承调用方的上下文（含当前 span）
+
+    提交的工作登记到当前任务（见 progress.track）。
+    """
+    if isinstance(executor, ProcessPoolExecutor):
+        return track(executor.submit(fn, *args, **kwargs))
+    return track(executor.submit(copy_context().run, fn, *args, **kwargs))
+
+
+def get_pool() -> ExecutorPool:
+    """获取进程级执行器层"""
+    return _pool
+
+
+def configure_executors(mode="thread", cpu_workers=None, io_workers=None):
+    """重新配置执行器层（会关闭已有的执行器）"""
+    global _pool
+    old, _pool = _pool, ExecutorPool(mode, cpu_workers, io_workers)
+    old.shutdown(wait=False)
+    return _pool
+
+
+async def run_blocking(kind: str, fn, *args, **kwargs):
+    """在执行器层中运行阻塞函数"""
+    return await _pool.run(kind, fn, *args, **kwargs)
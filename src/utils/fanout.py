@@ -0,0 +1,172 @@
+# fanout.py
+"""一对多比较：一个基线文件与多个候选文件
+
+基线只准备一次：固定在提取缓存中（指纹、逐页分类与文本页提取各计算一次），
+内存中的基线只落盘一次，各任务按该路径比较，渲染出的基线页面在各任务间共享。
+候选文件提交到一个专用任务队列并发比较（上限为 concurrency），
+返回逐候选结果与页面变化矩阵。
+
+进程池模式下计算任务在子进程中执行，子进程各自重新解析基线，
+只有落盘与渲染缓存在主进程中共享。
+"""
+
+import asyncio
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Dict, List, Union
+
+from ..pdf_processing.document_cache import document_cache, read_source
+from ..pdf_processing.image_processor import raster_cache
+from .async_utils import classify_pdf_pages
+from .batch import REPORT_FILE, BatchRunner, ComparePair, _load_json, _write_json
+from .executors import run_blocking
+from .jobs import JobManager
+
+# 一对多比较同时运行的候选数
+DEFAULT_CONCURRENCY = 4
+
+
+def prepare_baseline(source):
+    """预先计算基线的指纹、逐页分类与文本页提取结果"""
+    document = document_cache.get(source)
+    page_types = classify_pdf_pages(source)
+    document.load_pages(n for n, kind in sorted(page_types.items()) if kind == "text")
+
+
+def _spill(document, directory):
+    path = os.path.join(directory, "baseline.pdf")
+    with open(path, "wb") as f:
+        f.write(document.data)
+    return path
+
+
+@asynccontextmanager
+async def shared_baseline(baseline):
+    """准备并固定基线，退出时释放
+
+    产出供比较任务使用的基线路径：路径输入原样产出，内存中的基线落盘到
+    本次比较的临时目录，退出时删除。路径只交给本次比较的任务，不记录在
+    进程级的提取缓存中；按路径读取的文档按内容哈希命中同一份提取结果。
+    """
+    source = read_source(baseline)
+    document = await run_blocking("io", document_cache.pin, source)
+    try:
+        with tempfile.TemporaryDirectory(prefix="pdf_diff_baseline_") as directory:
+            if isinstance(source, (str, os.PathLike)):
+                path = source
+            else:
+                path = await run_blocking("io", _spill, document, directory)
+            raster_cache.pin(path)
+            try:
+                # 在主进程中准备，结果留在本进程的提取缓存中
+                await run_blocking("io", prepare_baseline, path)
+                yield path
+            finally:
+                raster_cache.unpin(path)
+    finally:
+        document_cache.unpin(document)
+
+
+def build_matrix(page_count: int, results: Dict[str, dict]) -> dict:
+    """基线页面 × 候选文件的变化矩阵
+
+    参数：
+    page_count (int): 基线页数
+    results (dict): 候选标识到比较结果的映射（结果需包含 page_map）
+
+    返回：
+    dict: candidates 为候选标识顺序；rows 为基线每页在各候选中的状态
+          （changed、unchanged、deleted，比较失败为 error）；
+          changed_pages 为各候选中有变化或被删除的基线页码；
+          inserted 为各候选插入的页数；page_changes 为基线每页有变化的候选数
+    """
+    candidates = list(results)
+    rows = [["unchanged"] * len(candidates) for _ in range(page_count)]
+    changed_pages, inserted = {}, {}
+    for column, candidate in enumerate(candidates):
+        result = results[candidate]
+        if result.get("type") == "error":
+            for row in rows:
+                row[column] = "error"
+            changed_pages[candidate] = inserted[candidate] = None
+            continue
+        changed_pages[candidate], inserted[candidate] = [], 0
+        for page1, _, status in result.get("page_map", ()):
+            if page1 is None:
+                inserted[candidate] += 1
+                continue
+            rows[page1][column] = status
+            if status != "unchanged":
+                changed_pages[candidate].append(page1)
+    return {
+        "candidates": candidates,
+        "rows": rows,
+        "changed_pages": changed_pages,
+        "inserted": inserted,
+        "page_changes": [
+            sum(status in ("changed", "deleted") for status in row) for row in rows
+        ],
+    }
+
+
+async def compare_fanout(
+    baseline,
+    candidates: Union[Dict[str, object], List],
+    timeout=None,
+    concurrency=DEFAULT_CONCURRENCY,
+) -> dict:
+    """将一个基线文件与多个候选文件并发比较
+
+    参数：
+    baseline: 基线PDF（路径、bytes 或文件对象）
+    candidates: 候选标识到PDF的映射，或PDF列表（以下标为标识）
+    timeout (float): 单个候选的超时秒数
+    concurrency (int): 同时比较的候选数 (默认: 4)
+
+    候选在专用任务队列中运行，不受进程级队列中批量名额的限制。
+
+    返回：
+    dict: results 为候选标识到比较结果的映射，matrix 为页面变化矩阵（见 build_matrix）
+    """
+    if not isinstance(candidates, dict):
+        candidates = {str(i): candidate for i, candidate in enumerate(candidates)}
+    manager = JobManager(max_jobs=concurrency, interactive_slots=0)
+    try:
+        async with shared_baseline(baseline) as source:
+            page_count = document_cache.get(source).page_count
+            jobs = {
+                name: manager.submit(
+                    source, read_source(candidate), priority="batch", timeout=timeout
+                )
+                for name, candidate in candidates.items()
+            }
+            await asyncio.gather(*(manager.wait_async(job) for job in jobs.values()))
+    finally:
+        await run_blocking("io", manager.shutdown)
+
+    results = {}
+    for name, job in jobs.items():
+        if job.status == "done":
+            results[name] = job.result
+        else:
+            results[name] = {"type": "error", "message": job.error or job.status}
+    return {"results": results, "matrix": build_matrix(page_count, results)}
+
+
+async def run_fanout_batch(
+    baseline: str, pairs: List[ComparePair], runner: BatchRunner
+) -> dict:
+    """批量命令行的一对多模式：结果文件同 BatchRunner，报告中附带页面变化矩阵"""
+    async with shared_baseline(baseline) as source:
+        page_count = document_cache.get(source).page_count
+        report = await runner.run(pairs)
+
+    results = {}
+    for pair in pairs:
+        record = _load_json(runner.result_path(pair))
+        ok = record is not None and record["status"] == "ok"
+        results[pair.pair_id] = record["result"] if ok else {"type": "error"}
+    report["matrix"] = build_matrix(page_count, results)
+    _write_json(os.path.join(runner.output_dir, REPORT_FILE), report)
+    return report
@@ -0,0 +1,123 @@
+# inference.py
+"""CPU 推理优化：批量前向传播、int8 动态量化、TorchScript 与线程数控制
+
+优化方式通过 PDF_DIFF_MODEL_OPTIMIZE 环境变量（'none'、'int8' 或 'torchscript'）
+选择，推理线程数通过 PDF_DIFF_TORCH_THREADS 设置。量化与 TorchScript 仅用于 CPU。
+"""
+
+import logging
+import os
+from typing import Iterable, List, Optional
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZATIONS = ("none", "int8", "torchscript")
+# 一次前向传播的默认样本数
+DEFAULT_BATCH_SIZE = 16
+
+
+def default_optimization() -> str:
+    return os.environ.get("PDF_DIFF_MODEL_OPTIMIZE", "none")
+
+
+def configure_threads(num_threads: Optional[int] = None) -> None:
+    """设置 PyTorch 算子内并行线程数，默认读取 PDF_DIFF_TORCH_THREADS"""
+    num_threads = num_threads or int(os.environ.get("PDF_DIFF_TORCH_THREADS", 0))
+    if num_threads and torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
+        logger.info(f"推理线程数: {num_threads}")
+
+
+def optimize_model(
+    model: nn.Module, optimize: str, device, example_input: torch.Tensor
+) -> nn.Module:
+    """按指定方式优化已切换到 eval() 的模型
+
+    参数：
+    optimize: 'none'、'int8'（对全连接层做动态量化）或 'torchscript'（追踪并冻结）
+    device: 模型所在设备，非 CPU 设备上不做优化
+    example_input: TorchScript 追踪使用的示例输入
+    """
+    if optimize not in OPTIMIZATIONS:
+        raise ValueError(f"不支持的优化方式: {optimize}")
+    if optimize == "none":
+        return model
+    if torch.device(device).type != "cpu":
+        logger.warning(f"{optimize} 优化仅支持 CPU，按原模型推理")
+        return model
+
+    model.eval()
+    if optimize == "int8":
+        # 动态量化只覆盖 nn.Linear，卷积层保持 fp32
+        return torch.ao.quantization.quantize_dynamic(
+            model, {nn.Linear}, dtype=torch.qint8
+        )
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, example_input.to(device))
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+
+def batched_forward(
+    model: nn.Module,
+    inputs: Iterable[torch.Tensor],
+    device,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> torch.Tensor:
+    """按批次执行前向传播并拼接输出
+
+    参数：
+    inputs: 单个样本 (C, H, W) 或批次 (N, C, H, W) 张量的序列，也可以是一个批次张量
+    """
+    if isinstance(inputs, torch.Tensor):
+        samples = list(inputs if inputs.dim() == 4 else inputs.unsqueeze(0))
+    else:
+        samples = []
+        for tensor in inputs:
+            samples.extend(tensor if tensor.dim() == 4 else tensor.unsqueeze(0))
+
+    outputs: List[torch.Tensor] = []
+    with torch.inference_mode():
+        for start in range(0, len(samples), batch_size):
+            batch = torch.stack(samples[start : start + batch_size]).to(device)
+            outputs.append(model(batch).cpu())
+    if not outputs:
+        return torch.empty(0)
+    return torch.cat(outputs)
+
+
+if __name__ == "__main__":
+    # 微基准：比较逐页 fp32 推理与批量/量化/TorchScript 推理的吞吐量（页/秒）
+    # 使用随机权重的 ResNet18，无需下载预训练权重
+    import argparse
+    import time
+
+    from torchvision.models import resnet18
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    configure_threads(args.threads)
+    pages = torch.randn(args.pages, 3, 224, 224)
+    example = pages[:1]
+
+    def benchmark(label, model, batch_size):
+        batched_forward(model, pages[:batch_size], "cpu", batch_size)  # 预热
+        start = time.perf_counter()
+        batched_forward(model, pages, "cpu", batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<28} {args.pages / elapsed:8.1f} 页/秒")
+
+    print(f"线程数: {torch.get_num_threads()}, 页数: {args.pages}")
+    for optimize in OPTIMIZATIONS:
+        model = resnet18(weights=None)
+        model.fc = nn.Linear(512, 2)
+        model = optimize_model(model.eval(), optimize, "cpu", example)
+        if optimize == "none":
+            benchmark("fp32 batch=1", model, 1)
+        benchmark(f"{optimize} batch={args.batch_size}", model, args.batch_size)
@@ -0,0 +1,235 @@
+# instrumentation.py
+"""比较流水线的分阶段计时与内存统计
+
+基于 Timer 的嵌套 span：每个 span 记录墙钟时间、执行线程的 CPU 时间、
+进程峰值 RSS 增量、tracemalloc 内存增量以及页数/单词数等计数。
+span 通过 contextvars 传递，执行器层在线程池中运行任务时会复制上下文，
+因此各阶段的 span 自动挂到发起请求的 trace 下。
+
+未开启 trace 时 span() 只做一次 contextvar 查询，几乎没有开销。
+
+环境变量：
+PDF_DIFF_TRACE=1          为每次比较开启 trace，结果中附带 "trace"
+PDF_DIFF_TRACE_FILE       trace 以 JSON lines 追加写入该文件
+PDF_DIFF_TRACE_MEMORY=1   同时开启 tracemalloc（开销较大）
+PDF_DIFF_PROFILE          单次请求的 cProfile 输出路径
+"""
+
+import cProfile
+import itertools
+import json
+import logging
+import os
+import threading
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from .timer import Timer
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不记录峰值 RSS
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+_span_ids = itertools.count(1)
+
+
+def _peak_rss_kb() -> Optional[int]:
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Span:
+    """一个阶段的计时与计数"""
+
+    __slots__ = (
+        "span_id",
+        "name",
+        "attrs",
+        "children",
+        "wall",
+        "cpu",
+        "rss_peak_kb",
+        "alloc_kb",
+        "alloc_peak_kb",
+        "thread",
+    )
+
+    def __init__(self, name: str, attrs: dict):
+        self.span_id = next(_span_ids)
+        self.name = name
+        self.attrs = attrs
+        self.children: List["Span"] = []
+        self.wall = None
+        self.cpu = None
+        self.rss_peak_kb = None
+        self.alloc_kb = None
+        self.alloc_peak_kb = None
+        self.thread = threading.current_thread().name
+
+    def set(self, **attrs) -> None:
+        """记录计数或属性（如页数、单词数）"""
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        data = {"name": self.name, "wall": self.wall, "cpu": self.cpu}
+        if self.rss_peak_kb is not None:
+            data["rss_peak_kb"] = self.rss_peak_kb
+        if self.alloc_kb is not None:
+            data["alloc_kb"] = self.alloc_kb
+            data["alloc_peak_kb"] = self.alloc_peak_kb
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.children:
+            data["children"] = [child.to_dict() for child in self.children]
+        return data
+
+
+class _NullSpan:
+    """未开启 trace 时使用的空 span"""
+
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """在当前 trace 下记录一个嵌套阶段；未开启 trace 时不做任何统计"""
+    parent = _current_span.get()
+    if parent is None:
+        yield NULL_SPAN
+        return
+
+    current = Span(name, attrs)
+    parent.children.append(current)
+    token = _current_span.set(current)
+    rss_before = _peak_rss_kb()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        alloc_before = tracemalloc.get_traced_memory()[0]
+    try:
+        with Timer() as timer:
+            yield current
+    finally:
+        _current_span.reset(token)
+        current.wall = round(timer.elapsed, 6)
+        current.cpu = round(timer.cpu_elapsed, 6)
+        if rss_before is not None:
+            current.rss_peak_kb = _peak_rss_kb() - rss_before
+        if tracing:
+            alloc_after, alloc_peak = tracemalloc.get_traced_memory()
+            current.alloc_kb = (alloc_after - alloc_before) // 1024
+            current.alloc_peak_kb = max(alloc_peak - alloc_before, 0) // 1024
+
+
+def traced_call(name: str, fn, *args, **kwargs):
+    """在 span 中调用函数（供执行器层在工作线程中使用）"""
+    with span(name):
+        return fn(*args, **kwargs)
+
+
+class Trace:
+    """一次请求的 span 树"""
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex
+        self.root = Span(name, attrs)
+
+    def to_dict(self) -> dict:
+        data = self.root.to_dict()
+        data["trace_id"] = self.trace_id
+        return data
+
+    def records(self) -> Iterator[dict]:
+        """展开为逐 span 的扁平记录（每条记录一行 JSON）"""
+        stack = [(self.root, None, 0)]
+        while stack:
+            current, parent_id, depth = stack.pop()
+            record = current.to_dict()
+            record.pop("children", None)
+            record.update(
+                trace_id=self.trace_id,
+                span_id=current.span_id,
+                parent_id=parent_id,
+                depth=depth,
+                thread=current.thread,
+            )
+            yield record
+            for child in reversed(current.children):
+                stack.append((child, current.span_id, depth + 1))
+
+    def export_jsonl(self, path: str) -> None:
+        """以 JSON lines 追加写入 trace"""
+        lines = "".join(
+            json.dumps(record, ensure_ascii=False, default=str) + "\n"
+            for record in self.records()
+        )
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "0") not in ("", "0", "false")
+
+
+@contextmanager
+def request_trace(name: str, enabled=None, profile=None, memory=None, **attrs):
+    """为一次请求开启 trace，未开启时产出 None
+
+    参数：
+    enabled (bool): 是否开启，默认读取 PDF_DIFF_TRACE
+    profile (str): cProfile 输出路径，默认读取 PDF_DIFF_PROFILE；
+                   只采样调用线程，需要完整调用栈时配合 PDF_DIFF_EXECUTOR=inline
+    memory (bool): 是否开启 tracemalloc，默认读取 PDF_DIFF_TRACE_MEMORY
+    """
+    enabled = _env_flag("PDF_DIFF_TRACE") if enabled is None else enabled
+    profile = os.environ.get("PDF_DIFF_PROFILE") if profile is None else profile
+    if not enabled and not profile:
+        yield None
+        return
+
+    memory = _env_flag("PDF_DIFF_TRACE_MEMORY") if memory is None else memory
+    started_tracemalloc = memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if profile else None
+
+    trace = Trace(name, **attrs)
+    token = _current_span.set(trace.root)
+    rss_before = _peak_rss_kb()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with Timer() as timer:
+            yield trace
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+            logger.info(f"cProfile 输出: {profile}")
+        _current_span.reset(token)
+        trace.root.wall = round(timer.elapsed, 6)
+        trace.root.cpu = round(timer.cpu_elapsed, 6)
+        if rss_before is not None:
+            trace.root.rss_peak_kb = _peak_rss_kb() - rss_before
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+        trace_file = os.environ.get("PDF_DIFF_TRACE_FILE")
+        if trace_file:
+            try:
+                trace.export_jsonl(trace_file)
+            except OSError as e:
+                logger.warning(f"写入 trace 失败: {e}")
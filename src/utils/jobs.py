@@ -0,0 +1,446 @@
+# jobs.py
+"""比较任务服务
+
+提交比较任务后立即返回任务 ID，任务在后台事件循环中运行：
+- 逐页进度以事件形式记录，可轮询（events / progress）或异步订阅（stream）
+- 取消与超时为协作式：在页面边界结束，已提交的页对跑完当前页后即停止；
+  任务状态立即更新，但并发名额在执行器中的工作全部返回后才释放
+- 全局并发上限，批量任务最多占用 max_jobs - interactive_slots 个名额，
+  交互任务始终有名额可用，不会被大批量任务饿死；
+  没有交互任务的进程（如批量命令行）通过 configure_job_manager 取消保留名额
+- heartbeat 任务需要调用方持续轮询，超过该时长无人询问时视为被放弃并取消
+
+Streamlit 前端与批量命令行都通过这里提交比较。
+
+环境变量：
+PDF_DIFF_MAX_JOBS      同时运行的比较任务数 (默认: 2)
+PDF_DIFF_JOB_TIMEOUT   默认任务超时秒数，0 表示不限制 (默认: 0)
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional
+
+from .async_utils import compare_cached
+from .progress import JobCancelled, JobControl, job_context
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("interactive", "batch")
+FINISHED = ("done", "failed", "cancelled", "timeout")
+DEFAULT_MAX_JOBS = 2
+# 为交互任务保留的名额
+INTERACTIVE_SLOTS = 1
+# 保留的已结束任务数量，超出后丢弃最早结束的任务（取走结果的调用方应直接 discard）
+MAX_FINISHED_JOBS = 16
+WATCHDOG_INTERVAL = 1.0
+
+
+class Job:
+    """一个比较任务的状态、进度事件与结果
+
+    status 为 queued、running、done、failed、cancelled 或 timeout；
+    事件为 {"seq", "time", "type": "status" | "progress", ...}。
+    """
+
+    def __init__(self, priority="interactive", timeout=None, heartbeat=None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"不支持的任务优先级: {priority}")
+        self.job_id = uuid.uuid4().hex
+        self.priority = priority
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.events: List[dict] = []
+        self.control = JobControl(on_progress=self._on_progress)
+        self.last_seen = time.monotonic()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._future = None
+        self._task = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def progress(self) -> Optional[dict]:
+        """最近一次进度事件"""
+        with self._lock:
+            return next(
+                (e for e in reversed(self.events) if e["type"] == "progress"), None
+            )
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        if self.started is None:
+            return None
+        return (self.finished_at or time.time()) - self.started
+
+    def touch(self) -> None:
+        """调用方仍在关注该任务（用于 heartbeat）"""
+        self.last_seen = time.monotonic()
+
+    def events_since(self, seq: int = 0) -> List[dict]:
+        with self._lock:
+            return self.events[seq:]
+
+    def _publish(self, event: dict) -> None:
+        with self._lock:
+            event["seq"] = next(self._seq)
+            event["time"] = time.time()
+            self.events.append(event)
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def _on_progress(self, stage: str, done: int, total: int) -> None:
+        self._publish(
+            {"type": "progress", "stage": stage, "done": done, "total": total}
+        )
+
+    def _set_status(self, status: str, message: Optional[str] = None) -> None:
+        self.status = status
+        if status == "running":
+            self.started = time.time()
+        elif status in FINISHED:
+            self.finished_at = time.time()
+            self.error = message
+        event = {"type": "status", "status": status}
+        if message:
+            event["message"] = message
+        self._publish(event)
+        if status in FINISHED:
+            with self._lock:
+                subscribers, self._subscribers = self._subscribers, []
+            for loop, queue in subscribers:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    async def stream(self) -> AsyncIterator[dict]:
+        """异步订阅任务事件（先产出已有事件），任务结束后迭代停止"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        with self._lock:
+            backlog = list(self.events)
+            subscribed = not self.finished
+            if subscribed:
+                self._subscribers.append((loop, queue))
+        for event in backlog:
+            yield event
+        if not subscribed:
+            return
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            with self._lock:
+                if (loop, queue) in self._subscribers:
+                    self._subscribers.remove((loop, queue))
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "priority": self.priority,
+            "status": self.status,
+            "error": self.error,
+            "progress": self.progress,
+            "elapsed": self.elapsed,
+        }
+
+
+class JobManager:
+    """比较任务队列
+
+    参数：
+    max_jobs (int): 同时运行的任务数 (默认: PDF_DIFF_MAX_JOBS 或 2)
+    interactive_slots (int): 为交互任务保留的名额 (默认: 1，0 表示不保留)
+    default_timeout (float): 未指定超时的任务使用的超时秒数 (默认: PDF_DIFF_JOB_TIMEOUT)
+
+    任务在独立线程的事件循环中运行，submit / cancel / get 可在任意线程调用。
+    """
+
+    def __init__(
+        self, max_jobs=None, interactive_slots=INTERACTIVE_SLOTS, default_timeout=None
+    ):
+        self.max_jobs = max_jobs or int(
+            os.environ.get("PDF_DIFF_MAX_JOBS", DEFAULT_MAX_JOBS)
+        )
+        self.interactive_slots = max(0, min(interactive_slots, self.max_jobs - 1))
+        if default_timeout is None:
+            default_timeout = float(os.environ.get("PDF_DIFF_JOB_TIMEOUT", 0)) or None
+        self.default_timeout = default_timeout
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._slots = None
+        self._batch_slots = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                ready = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run_loop, args=(ready,), name="jobs", daemon=True
+                )
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    def _run_loop(self, ready: threading.Event) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        # 信号量在任务循环内创建；批量任务先占批量名额，再占全局名额
+        self._slots = asyncio.Semaphore(self.max_jobs)
+        self._batch_slots = asyncio.Semaphore(self.max_jobs - self.interactive_slots)
+        loop.create_task(self._watchdog())
+        ready.set()
+        loop.run_forever()
+
+    def submit(
+        self,
+        source1,
+        source2,
+        priority="interactive",
+        timeout=None,
+        heartbeat=None,
+        trace=None,
+    ) -> Job:
+        """提交比较任务，立即返回任务
+
+        参数：
+        source1, source2: PDF文件路径或内容（bytes）
+        priority (str): 'interactive' 或 'batch'
+        timeout (float): 运行超时秒数（不含排队时间），默认使用 default_timeout
+        heartbeat (float): 超过该秒数无人轮询（get / touch）时取消任务
+        trace (bool): 是否在结果中附带 trace
+        """
+        job = Job(priority, timeout or self.default_timeout, heartbeat)
+        loop = self._ensure_loop()
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        job._publish({"type": "status", "status": "queued"})
+        job._future = asyncio.run_coroutine_threadsafe(
+            self._run(job, source1, source2, trace), loop
+        )
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """获取任务（同时刷新 heartbeat）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.touch()
+        return job
+
+    def discard(self, job_id: str) -> None:
+        """丢弃已结束的任务及其结果（调用方已取走结果时释放内存）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished:
+                del self._jobs[job_id]
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> bool:
+        """取消任务：排队中的任务立即结束，运行中的任务在下一个页面边界结束"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.control.cancel(reason)
+        # 任务协程捕获取消后记录状态，job._future 始终正常结束
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(_cancel_task, job)
+        return True
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Job:
+        """同步等待任务结束，最多等待 timeout 秒"""
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        concurrent.futures.wait([job._future], timeout)
+        return job
+
+    async def wait_async(self, job: Job) -> Job:
+        """在调用方的事件循环中等待任务结束；等待被取消时同时取消任务"""
+        try:
+            await asyncio.shield(asyncio.wrap_future(job._future))
+        except asyncio.CancelledError:
+            if not job.finished:
+                self.cancel(job.job_id)
+                raise
+        return job
+
+    async def _run(self, job: Job, source1, source2, trace) -> None:
+        job._task = asyncio.current_task()
+        try:
+            if job.control.cancelled:
+                raise JobCancelled(job.control.reason)
+            async with self._admission(job):
+                try:
+                    await self._execute(job, source1, source2, trace)
+                finally:
+                    # 取消或超时后执行器中的工作仍会跑完当前页，返回后才释放名额
+                    await _settle(job.control)
+        except (asyncio.CancelledError, JobCancelled):
+            # 排队中被取消（或关闭时等待工作返回被中断）
+            if not job.finished:
+                job._set_status("cancelled", job.control.reason)
+
+    async def _execute(self, job: Job, source1, source2, trace) -> None:
+        try:
+            if job.control.cancelled:
+                raise JobCancelled(job.control.reason)
+            job._set_status("running")
+            with job_context(job.control):
+                result = await asyncio.wait_for(
+                    compare_cached(source1, source2, trace=trace), job.timeout
+                )
+        except asyncio.TimeoutError:
+            # 通知仍在工作线程中的阶段在页面边界停止
+            job.control.cancel("timeout")
+            job._set_status("timeout", f"任务超时（{job.timeout}s）")
+        except (asyncio.CancelledError, JobCancelled):
+            status = "timeout" if job.control.reason == "timeout" else "cancelled"
+            job._set_status(status, job.control.reason)
+        except Exception as e:
+            logger.exception(f"任务失败: {job.job_id}")
+            job._set_status("failed", str(e))
+        else:
+            job.result = result
+            if result.get("type") == "error":
+                job._set_status("failed", result.get("message"))
+            else:
+                job._set_status("done")
+
+    def _admission(self, job: Job):
+        if job.priority == "batch":
+            return _Nested(self._batch_slots, self._slots)
+        return _Nested(self._slots)
+
+    async def _watchdog(self) -> None:
+        # 取消无人轮询的 heartbeat 任务（如用户已离开页面的前端会话）
+        while True:
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            now = time.monotonic()
+            for job in self.jobs():
+                if (
+                    job.heartbeat is not None
+                    and not job.finished
+                    and now - job.last_seen > job.heartbeat
+                ):
+                    logger.info(f"任务无人轮询，取消: {job.job_id}")
+                    self.cancel(job.job_id, "abandoned")
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        """取消所有任务，等待任务协程结束后停止事件循环"""
+        for job in self.jobs():
+            self.cancel(job.job_id, "shutdown")
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(_drain(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+
+async def _drain() -> None:
+    current = asyncio.current_task()
+    tasks = [task for task in asyncio.all_tasks() if task is not current]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _settle(control) -> None:
+    """等待任务登记的执行器工作全部返回"""
+    while True:
+        pending = control.pending()
+        if not pending:
+            return
+        # 工作的结果与异常已由任务本身处理，这里只等待其返回
+        await asyncio.gather(
+            *(asyncio.wrap_future(future) for future in pending),
+            return_exceptions=True,
+        )
+
+
+def _cancel_task(job: Job) -> None:
+    if job._task is not None and not job.finished:
+        job._task.cancel()
+
+
+class _Nested:
+    """依次获取多个信号量，逆序释放"""
+
+    def __init__(self, *semaphores):
+        self.semaphores = semaphores
+
+    async def __aenter__(self):
+        acquired = []
+        try:
+            for semaphore in self.semaphores:
+                await semaphore.acquire()
+                acquired.append(semaphore)
+        except BaseException:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+            raise
+
+    async def __aexit__(self, *exc):
+        for semaphore in reversed(self.semaphores):
+            semaphore.release()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """获取进程级任务队列（首次使用时创建）"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+
+def configure_job_manager(
+    max_jobs=None, interactive_slots=INTERACTIVE_SLOTS, default_timeout=None
+) -> JobManager:
+    """重新配置进程级任务队列（会取消并关闭已有队列中的任务）"""
+    global _manager
+    with _manager_lock:
+        old, _manager = _manager, JobManager(
+            max_jobs, interactive_slots, default_timeout
+        )
+    if old is not None:
+        old.shutdown()
+    return _manager
@@ -0,0 +1,84 @@
+# model_registry.py
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """进程级模型注册表，避免每次比较都重新加载模型权重
+
+    特性：
+    - 惰性加载：首次 get 时才调用工厂函数构建模型
+    - 线程安全：同一个 key 的模型只会被构建一次
+    - 预热钩子：preload 可在服务启动时提前加载已注册的模型
+
+    注册表中的模型均为 eval() 模式，调用方只能用于推理，不应修改其参数。
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], nn.Module]] = {}
+        self._models: Dict[str, nn.Module] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def register(self, key: str, factory: Callable[[], nn.Module]) -> None:
+        """注册模型工厂（重复注册同一 key 时保留首次注册的工厂）"""
+        with self._lock:
+            self._factories.setdefault(key, factory)
+
+    def get(
+        self, key: str, factory: Optional[Callable[[], nn.Module]] = None
+    ) -> nn.Module:
+        """获取模型，不存在时使用工厂函数构建
+
+        参数：
+        key: 模型标识
+        factory: 模型工厂函数，未注册过的 key 必须提供
+
+        返回：
+        nn.Module: 已切换到 eval() 模式的共享模型
+        """
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if factory is not None:
+                self._factories.setdefault(key, factory)
+            factory = self._factories.get(key)
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        if factory is None:
+            raise KeyError(f"未注册的模型: {key}")
+
+        # 按 key 加锁，加载较慢的模型不会阻塞其他模型的获取
+        with key_lock:
+            model = self._models.get(key)
+            if model is None:
+                logger.info(f"加载模型: {key}")
+                model = factory()
+                model.eval()
+                self._models[key] = model
+        return model
+
+    def preload(self, keys: Optional[Iterable[str]] = None) -> None:
+        """预热模型，默认加载所有已注册的模型"""
+        with self._lock:
+            targets = list(keys) if keys is not None else list(self._factories)
+        for key in targets:
+            self.get(key)
+
+    def loaded(self) -> list:
+        """返回已加载模型的 key 列表"""
+        return list(self._models)
+
+    def clear(self) -> None:
+        """释放所有已加载的模型（保留工厂注册）"""
+        with self._lock:
+            self._models.clear()
+
+
+registry = ModelRegistry()
@@ -0,0 +1,98 @@
+# progress.py
+"""任务进度上报与协作式取消
+
+比较任务运行时在上下文中绑定一个 JobControl，流水线在页面边界调用 checkpoint()：
+上报当前阶段的进度，任务已被取消（或超时）时抛出 JobCancelled 结束本次比较。
+JobControl 通过 contextvars 传递，执行器层复制上下文，工作线程中同样可见；
+进程池中的任务看不到调用方的上下文，只能在阶段边界取消。
+
+执行器层提交的工作通过 track() 登记到当前任务：取消或超时后这些工作仍会跑完当前页，
+任务队列等待它们返回后才释放并发名额。
+
+未绑定任务时 checkpoint() 与 track() 只做一次 contextvar 查询。
+"""
+
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+
+class JobCancelled(Exception):
+    """任务已被取消或超时"""
+
+
+class JobControl:
+    """一个任务的取消标志与进度回调（线程安全）
+
+    参数：
+    on_progress: 进度回调 on_progress(stage, done, total)，在上报进度的线程中调用
+    """
+
+    def __init__(self, on_progress: Optional[Callable[[str, int, int], None]] = None):
+        self.on_progress = on_progress
+        self.reason = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def report(self, stage: str, done: int, total: int) -> None:
+        if self.on_progress is not None:
+            self.on_progress(stage, done, total)
+
+    def track(self, future: Future) -> None:
+        """登记在执行器中运行的工作，完成后自动移除"""
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._untrack)
+
+    def _untrack(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+
+    def pending(self) -> List[Future]:
+        """尚未完成的已登记工作"""
+        with self._lock:
+            return list(self._pending)
+
+
+_current_job: ContextVar[Optional[JobControl]] = ContextVar("job", default=None)
+
+
+@contextmanager
+def job_context(control: JobControl):
+    """在当前上下文中绑定任务控制"""
+    token = _current_job.set(control)
+    try:
+        yield control
+    finally:
+        _current_job.reset(token)
+
+
+def track(future: Future) -> Future:
+    """将执行器中的工作登记到当前任务（未绑定任务时不做任何事）"""
+    control = _current_job.get()
+    if control is not None:
+        control.track(future)
+    return future
+
+
+def checkpoint(stage: str, done: Optional[int] = None, total: Optional[int] = None):
+    """页面或阶段边界：上报进度，任务已取消时抛出 JobCancelled"""
+    control = _current_job.get()
+    if control is None:
+        return
+    if control.cancelled:
+        raise JobCancelled(control.reason)
+    if done is not None:
+        control.report(stage, done, total)
@@ -0,0 +1,133 @@
+# result_cache.py
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 比较流水线的配置版本，流水线行为变化时递增以使旧缓存失效
+CONFIG_VERSION = "6"
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+class ResultCache:
+    """基于内容寻址的磁盘结果缓存
+
+    以 (sha256(file1), sha256(file2), 配置版本, 影响结果的设置) 为键保存完整比较结果
+    （差异详情、标注PDF与差异区域），按总大小做 LRU 淘汰。
+    读取命中时更新文件修改时间作为最近使用时间。
+
+    参数：
+    cache_dir (str): 缓存目录
+    max_bytes (int): 缓存总大小上限 (默认: 2GB)
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        digest1: str,
+        digest2: str,
+        settings: Optional[dict] = None,
+        config_version: str = CONFIG_VERSION,
+    ) -> str:
+        """缓存键：文件摘要、配置版本与影响比较结果的设置（提取后端、dpi 等）的哈希"""
+        payload = json.dumps(
+            [digest1, digest2, config_version, settings or {}],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            os.utime(path)
+            return result
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取缓存失败，忽略该条目: {e}")
+            return None
+
+    def put(self, key: str, result: dict) -> None:
+        # 先写入临时文件再原子替换，避免并发读取到不完整的条目
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        """按最近使用时间淘汰条目，直到总大小不超过上限"""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".pkl"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".pkl"):
+                    os.remove(entry.path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """获取进程级结果缓存；设置 PDF_DIFF_RESULT_CACHE=0 时禁用
+
+    缓存目录默认为项目根目录下的 data/cache，可通过 PDF_DIFF_CACHE_DIR 指定，
+    大小上限可通过 PDF_DIFF_CACHE_MAX_BYTES 指定。
+    """
+    global _cache
+    if os.environ.get("PDF_DIFF_RESULT_CACHE", "1") == "0":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            project_root = os.path.dirname(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            )
+            cache_dir = os.environ.get(
+                "PDF_DIFF_CACHE_DIR", os.path.join(project_root, "data", "cache")
+            )
+            max_bytes = int(
+                os.environ.get("PDF_DIFF_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+            )
+            _cache = ResultCache(cache_dir, max_bytes)
+    return _cache
@@ -8,14 +8,23 @@ def Timer():
         def __init__(self):
             self.start = 0
             self.end = 0
+            self.cpu_start = 0
+            self.cpu_end = 0
 
         @property
         def elapsed(self):
             return self.end - self.start
 
+        @property
+        def cpu_elapsed(self):
+            """当前线程消耗的 CPU 时间"""
+            return self.cpu_end - self.cpu_start
+
     timer = _Timer()
-    timer.start = time.time()
+    timer.start = time.perf_counter()
+    timer.cpu_start = time.thread_time()
     try:
         yield timer
     finally:
-        timer.end = time.time()
+        timer.end = time.perf_counter()
+        timer.cpu_end = time.thread_time()
@@ -0,0 +1,31 @@
+"""逐页分类启发式规则测试"""
+
+import pytest
+
+from src.pdf_processing.classifier import PDFClassifier
+from src.pdf_processing.fingerprint import PageFingerprint
+
+CASES = {
+    "blank": (0, 0.0, "text"),
+    "text": (1500, 0.0, "text"),
+    "text-with-logo": (1500, 0.05, "text"),
+    "ocr-scan": (1500, 1.0, "text"),
+    "scan": (0, 1.0, "image"),
+    "scan-with-stamp-text": (20, 0.9, "image"),
+    "figure-only": (0, 0.2, "image"),
+    "figure-with-caption": (40, 0.3, None),
+}
+
+
+@pytest.mark.parametrize("case", CASES.values(), ids=CASES.keys())
+def test_page_heuristic(case):
+    char_count, coverage, expected = case
+    fingerprint = PageFingerprint(
+        "digest",
+        "text",
+        char_count > 0,
+        coverage > 0,
+        char_count=char_count,
+        image_coverage=coverage,
+    )
+    assert PDFClassifier._page_heuristic(fingerprint) == expected
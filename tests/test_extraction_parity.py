@@ -0,0 +1,43 @@
+"""两种文本提取后端的一致性测试
+
+pdfplumber 与 PyMuPDF 对同一文件对应得到相同的单词级差异与页面统计。
+容许的差异：高亮矩形的上下边界。pdfplumber 按字号计算字符高度，PyMuPDF 按字体的
+ascender/descender 计算，同一行的 top/bottom 最多相差约 2.5pt；水平坐标一致。
+"""
+
+import pytest
+
+from benchmarks.synthetic import make_pair
+from src.pdf_processing.text_processor import TextProcessor
+
+# 高亮矩形的容差（pt）
+HORIZONTAL_TOLERANCE = 0.01
+VERTICAL_TOLERANCE = 3.0
+
+CASES = {
+    "text": dict(kind="text", pages=6, edit_density=0.02),
+    "text-dense": dict(kind="text", pages=3, edit_density=0.3, seed=3),
+    "mixed": dict(kind="mixed", pages=6, edit_density=0.02, seed=1),
+    "inserted-pages": dict(kind="text", pages=6, edit_density=0.02, inserts=2, seed=2),
+}
+
+
+@pytest.mark.parametrize("case", CASES.values(), ids=CASES.keys())
+def test_backends_agree(case):
+    original, modified = make_pair(**case)
+    expected = TextProcessor(extractor="pdfplumber").compare_pages(original, modified)
+    actual = TextProcessor(extractor="pymupdf").compare_pages(original, modified)
+
+    assert actual["page_stats"] == expected["page_stats"]
+    assert expected["details"], "测试文件对应包含差异"
+    assert len(actual["details"]) == len(expected["details"])
+    for want, got in zip(expected["details"], actual["details"]):
+        assert (got["type"], got["content"]) == (want["type"], want["content"])
+        assert got["position"]["page"] == want["position"]["page"]
+        assert got["position"]["words"] == want["position"]["words"]
+        assert len(got["position"]["rects"]) == len(want["position"]["rects"])
+        for rect1, rect2 in zip(want["position"]["rects"], got["position"]["rects"]):
+            assert rect2[0] == pytest.approx(rect1[0], abs=HORIZONTAL_TOLERANCE)
+            assert rect2[2] == pytest.approx(rect1[2], abs=HORIZONTAL_TOLERANCE)
+            assert rect2[1] == pytest.approx(rect1[1], abs=VERTICAL_TOLERANCE)
+            assert rect2[3] == pytest.approx(rect1[3], abs=VERTICAL_TOLERANCE)
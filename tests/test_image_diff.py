@@ -0,0 +1,46 @@
+"""由粗到细分块 SSIM 的测试"""
+
+import cv2
+import numpy as np
+import pytest
+
+from src.diff_detection.image_diff import (
+    CHANGED_PIXEL,
+    TILE_SIZE,
+    ImageComparator,
+    _to_mask,
+    ssim_map,
+)
+
+
+@pytest.fixture(scope="module")
+def page():
+    """由随机长度的“文字行”组成的灰度页面"""
+    rng = np.random.default_rng(0)
+    img = np.full((1100, 850), 255, np.uint8)
+    for y in range(40, 1060, 22):
+        x = 40
+        while x < 800:
+            w = int(rng.integers(10, 60))
+            cv2.rectangle(img, (x, y), (min(x + w, 810), y + 10), 0, -1)
+            x += w + 8
+    return img
+
+
+@pytest.mark.parametrize("offset", [-32, -2, 1, 3])
+@pytest.mark.parametrize("value", [90, 200])
+def test_change_on_tile_boundary_matches_full_ssim(page, offset, value):
+    """跨越分块边界（只有几个像素落在相邻分块内）的改动与整页 SSIM 的差异像素一致"""
+    modified = page.copy()
+    x = TILE_SIZE + offset
+    cv2.rectangle(modified, (x, 300), (x + 30, 330), value, 2)
+
+    _, mask, regions = ImageComparator().tiled_score(page, modified)
+    full = _to_mask(ssim_map(page, modified))
+    assert regions
+    np.testing.assert_array_equal(mask < CHANGED_PIXEL, full < CHANGED_PIXEL)
+
+
+def test_identical_pages(page):
+    score, mask, regions = ImageComparator().tiled_score(page, page.copy())
+    assert score == 1.0 and regions == [] and mask.min() == 255
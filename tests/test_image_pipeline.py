@@ -0,0 +1,45 @@
+"""多页图像比较流水线测试（用 PyMuPDF 代替 poppler 渲染页面）"""
+
+import fitz
+import numpy as np
+import pytest
+from PIL import Image
+
+from benchmarks.synthetic import make_pair
+from src.diff_detection import image_pipeline
+from src.diff_detection.image_pipeline import ImageDiffPipeline
+
+
+def _render_run(processor, pdf_path, first, count):
+    with fitz.open(pdf_path) as doc:
+        for page in doc.pages(first, first + count):
+            pix = page.get_pixmap(dpi=processor.dpi, colorspace=fitz.csRGB)
+            yield Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+@pytest.fixture
+def scan_pair(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_pipeline, "_render_run", _render_run)
+    paths = []
+    for name, data in zip(("original", "modified"), make_pair("scan", pages=3)):
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(data)
+        paths.append(str(path))
+    return paths
+
+
+def test_masks_dropped_by_default(scan_pair):
+    """默认不保留相似度图，结果大小与页数和分辨率无关"""
+    result = ImageDiffPipeline(dpi=72, max_workers=2).compare(*scan_pair)
+    changed = [page for page in result["pages"] if page["status"] == "changed"]
+    assert changed
+    assert all(page["diff"] is None and page["regions"] for page in changed)
+
+
+def test_keep_masks(scan_pair):
+    result = ImageDiffPipeline(dpi=72, max_workers=2, keep_masks=True).compare(
+        *scan_pair
+    )
+    changed = [page for page in result["pages"] if page["status"] == "changed"]
+    assert changed
+    assert all(isinstance(page["diff"], np.ndarray) for page in changed)
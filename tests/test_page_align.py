@@ -0,0 +1,49 @@
+"""页面序列对齐测试"""
+
+import hashlib
+import random
+import time
+
+from src.diff_detection.page_align import align_pages
+from src.pdf_processing.fingerprint import PageFingerprint, text_signature
+
+WORDS = [f"w{i}" for i in range(2000)]
+
+
+def _fingerprint(text):
+    text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return PageFingerprint(
+        text_hash, text_hash, True, False, signature=text_signature(text)
+    )
+
+
+def _pages(count, seed):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=200)) for _ in range(count)]
+
+
+def test_every_page_edited_with_one_insertion():
+    """每页都有修改（页脚不同）且插入一页时，其余页面仍与原页配对"""
+    original = _pages(500, seed=0)
+    modified = [f"{text} footer-{i}" for i, text in enumerate(original)]
+    modified.insert(10, _pages(1, seed=1)[0])
+
+    start = time.perf_counter()
+    pairs = align_pages(
+        [_fingerprint(text) for text in original],
+        [_fingerprint(text) for text in modified],
+    )
+    elapsed = time.perf_counter() - start
+
+    expected = [(i, i) for i in range(10)] + [(None, 10)]
+    expected += [(i, i + 1) for i in range(10, 500)]
+    assert pairs == expected
+    assert elapsed < 5
+
+
+def test_unrelated_block_keeps_positional_pairs():
+    """互不相似的大块找不到锚点时按位置配对，多余页面视为插入"""
+    fps1 = [_fingerprint(text) for text in _pages(120, seed=2)]
+    fps2 = [_fingerprint(text) for text in _pages(121, seed=3)]
+    pairs = align_pages(fps1, fps2)
+    assert pairs == [(i, i) for i in range(120)] + [(None, 120)]
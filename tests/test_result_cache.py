@@ -0,0 +1,28 @@
+"""结果缓存键测试"""
+
+import pytest
+
+from src.utils.async_utils import comparison_settings
+from src.utils.result_cache import ResultCache
+
+
+def test_key_depends_on_settings():
+    settings = {"extractor": "pdfplumber", "dpi": 200, "changed_ratio": 1e-4}
+    key = ResultCache.make_key("a", "b", settings)
+    assert key == ResultCache.make_key("a", "b", dict(settings))
+    for name, value in (("extractor", "pymupdf"), ("dpi", 300), ("changed_ratio", 0)):
+        assert key != ResultCache.make_key("a", "b", {**settings, name: value})
+    assert key != ResultCache.make_key("b", "a", settings)
+    assert key != ResultCache.make_key("a", "b", settings, config_version="0")
+
+
+@pytest.mark.parametrize(
+    "variable, value",
+    [("PDF_DIFF_EXTRACTOR", "pymupdf"), ("PDF_DIFF_MODEL_OPTIMIZE", "int8")],
+)
+def test_settings_follow_environment(monkeypatch, variable, value):
+    monkeypatch.delenv("PDF_DIFF_EXTRACTOR", raising=False)
+    monkeypatch.delenv("PDF_DIFF_MODEL_OPTIMIZE", raising=False)
+    default = comparison_settings()
+    monkeypatch.setenv(variable, value)
+    assert comparison_settings() != default